@@ -3,10 +3,11 @@ import logging
 from homeassistant.config_entries import ConfigEntry, SOURCE_IMPORT
 from homeassistant.core import HomeAssistant, callback
 from homeassistant.const import CONF_TOKEN, Platform
-from .const import DOMAIN, CONF_FILTER, CONF_INCLUDE_ENTITIES
-from .service import DuerService
+from .const import DOMAIN, CONF_FILTER, CONF_INCLUDE_ENTITIES, DATA_CONNECTIONS
+from .connections import DuerConnections
+from .service import DuerService, async_remove_storage
 _LOGGER = logging.getLogger(__name__)
-CONST_PLATFORMS = [Platform.BINARY_SENSOR,]
+CONST_PLATFORMS = [Platform.BINARY_SENSOR, Platform.SENSOR]
 
 
 async def _async_update_listener(hass: HomeAssistant, entry: ConfigEntry) -> None:
@@ -21,6 +22,8 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up bemfa from a config entry."""
     if not hass.data.get(DOMAIN):
         hass.data.setdefault(DOMAIN, {})
+    if DATA_CONNECTIONS not in hass.data[DOMAIN]:
+        hass.data[DOMAIN][DATA_CONNECTIONS] = DuerConnections(hass)
     entry.async_on_unload(entry.add_update_listener(_async_update_listener))
     entity_filter = {}
     enttities = []
@@ -34,16 +37,17 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         entity_filter = data_conf.get(CONF_FILTER, {})
     else:
         entity_filter = options_conf.get(CONF_FILTER, {})
+    sync_conf = options_conf or data_conf
     if len(entity_filter[CONF_INCLUDE_ENTITIES]) > 0:
         enttities = entity_filter[CONF_INCLUDE_ENTITIES]
         _LOGGER.debug(f'include entities:{enttities}')
-    service = DuerService(hass, entry.data[CONF_TOKEN])
+    service = DuerService(hass, entry.data[CONF_TOKEN], sync_conf, entry.entry_id,
+                          hass.data[DOMAIN][DATA_CONNECTIONS])
+    if not await service.async_start(enttities):
+        return False
     hass.data[DOMAIN][entry.entry_id] = {
         "service": service,
     }
-    await service.async_start(
-        enttities
-    )
     # for platform in CONST_PLATFORMS:
     #     hass.async_create_task(
     await hass.config_entries.async_forward_entry_setups(
@@ -57,7 +61,7 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     data = hass.data[DOMAIN].get(entry.entry_id)
     unload_ok = False
     if data is not None:
-        data["service"].stop()
+        await data["service"].async_stop()
         unload_ok = await hass.config_entries.async_unload_platforms(entry, CONST_PLATFORMS)
         if unload_ok:
             hass.data[DOMAIN].pop(entry.entry_id)
@@ -66,7 +70,5 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
 
 async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
     """Remove a config entry."""
-    # await hass.async_add_executor_job(
-    #     remove_state_files_for_entry_id, hass, entry.entry_id
-    # )
     _LOGGER.debug('remove entry invoke')
+    await async_remove_storage(hass, entry.entry_id)
@@ -0,0 +1,58 @@
+"""Content fingerprint of the entity catalog synced to the Duer platform."""
+from __future__ import annotations
+
+import hashlib
+
+from homeassistant.core import HomeAssistant, State
+from homeassistant.helpers.storage import Store
+
+from .const import CATALOG_SAVE_DELAY, CATALOG_STORAGE_VERSION
+from .state_encoder import encode_catalog_json
+
+
+def entity_hash(state: State, salt: str = '') -> str:
+    """Hash of the catalog entry of an entity.
+
+    salt names the options changing how entries are encoded, changing it
+    changes every hash so the entries are uploaded again.
+    """
+    digest = hashlib.blake2b(salt.encode(), digest_size=8)
+    digest.update(encode_catalog_json(state))
+    return digest.hexdigest()
+
+
+def catalog_fingerprint(hashes: dict[str, str]) -> str:
+    """Root hash over the hash of every entity."""
+    digest = hashlib.blake2b(digest_size=16)
+    for entity_id in sorted(hashes):
+        digest.update(f'{entity_id}:{hashes[entity_id]}\n'.encode())
+    return digest.hexdigest()
+
+
+class EntityCatalog:
+    """Hashes of the last catalog the server acknowledged, kept in HA storage."""
+
+    def __init__(self, hass: HomeAssistant, key: str) -> None:
+        """Initialize."""
+        self._store = Store(hass, CATALOG_STORAGE_VERSION, key)
+        self.hashes: dict[str, str] = {}
+        self.fingerprint: str | None = None
+
+    async def async_load(self) -> None:
+        data = await self._store.async_load()
+        if isinstance(data, dict):
+            self.hashes = data.get('hashes', {})
+            self.fingerprint = data.get('fingerprint')
+
+    def diff(self, hashes: dict[str, str]) -> tuple[list[str], list[str]]:
+        """Return the added or changed and the removed entity ids."""
+        changed = [entity_id for entity_id, value in hashes.items()
+                   if self.hashes.get(entity_id) != value]
+        removed = [entity_id for entity_id in self.hashes if entity_id not in hashes]
+        return changed, removed
+
+    def update(self, hashes: dict[str, str], fingerprint: str) -> None:
+        self.hashes = hashes
+        self.fingerprint = fingerprint
+        self._store.async_delay_save(
+            lambda: {'hashes': self.hashes, 'fingerprint': self.fingerprint}, CATALOG_SAVE_DELAY)
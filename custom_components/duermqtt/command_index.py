@@ -0,0 +1,148 @@
+"""Index of the included entities to validate inbound commands in O(1)."""
+from __future__ import annotations
+
+from collections.abc import Iterable
+
+from homeassistant.components.climate import ClimateEntityFeature
+from homeassistant.components.cover import CoverEntityFeature
+from homeassistant.components.fan import FanEntityFeature
+from homeassistant.components.media_player import MediaPlayerEntityFeature
+from homeassistant.components.water_heater import WaterHeaterEntityFeature
+from homeassistant.const import (
+    ATTR_DOMAIN,
+    ATTR_SERVICE,
+    ATTR_SUPPORTED_FEATURES,
+    EVENT_SERVICE_REGISTERED,
+    EVENT_SERVICE_REMOVED,
+)
+from homeassistant.core import Event, HomeAssistant, State, callback, split_entity_id
+
+from .const import (
+    ERR_INVALID_COMMAND,
+    ERR_UNKNOWN_ENTITY,
+    ERR_UNKNOWN_SERVICE,
+    ERR_UNSUPPORTED_FEATURE,
+)
+
+# (domain, service) to the supported features of which the entity needs one
+REQUIRED_FEATURES: dict[tuple[str, str], int] = {
+    ('cover', 'open_cover'): CoverEntityFeature.OPEN,
+    ('cover', 'close_cover'): CoverEntityFeature.CLOSE,
+    ('cover', 'stop_cover'): CoverEntityFeature.STOP,
+    ('cover', 'set_cover_position'): CoverEntityFeature.SET_POSITION,
+    ('cover', 'open_cover_tilt'): CoverEntityFeature.OPEN_TILT,
+    ('cover', 'close_cover_tilt'): CoverEntityFeature.CLOSE_TILT,
+    ('cover', 'stop_cover_tilt'): CoverEntityFeature.STOP_TILT,
+    ('cover', 'set_cover_tilt_position'): CoverEntityFeature.SET_TILT_POSITION,
+    ('climate', 'set_temperature'): (ClimateEntityFeature.TARGET_TEMPERATURE
+                                     | ClimateEntityFeature.TARGET_TEMPERATURE_RANGE),
+    ('climate', 'set_humidity'): ClimateEntityFeature.TARGET_HUMIDITY,
+    ('climate', 'set_fan_mode'): ClimateEntityFeature.FAN_MODE,
+    ('climate', 'set_preset_mode'): ClimateEntityFeature.PRESET_MODE,
+    ('climate', 'set_swing_mode'): ClimateEntityFeature.SWING_MODE,
+    ('fan', 'set_percentage'): FanEntityFeature.SET_SPEED,
+    ('fan', 'increase_speed'): FanEntityFeature.SET_SPEED,
+    ('fan', 'decrease_speed'): FanEntityFeature.SET_SPEED,
+    ('fan', 'oscillate'): FanEntityFeature.OSCILLATE,
+    ('fan', 'set_direction'): FanEntityFeature.DIRECTION,
+    ('fan', 'set_preset_mode'): FanEntityFeature.PRESET_MODE,
+    ('media_player', 'volume_set'): MediaPlayerEntityFeature.VOLUME_SET,
+    ('media_player', 'volume_mute'): MediaPlayerEntityFeature.VOLUME_MUTE,
+    ('media_player', 'media_play'): MediaPlayerEntityFeature.PLAY,
+    ('media_player', 'media_pause'): MediaPlayerEntityFeature.PAUSE,
+    ('media_player', 'media_next_track'): MediaPlayerEntityFeature.NEXT_TRACK,
+    ('media_player', 'media_previous_track'): MediaPlayerEntityFeature.PREVIOUS_TRACK,
+    ('media_player', 'select_source'): MediaPlayerEntityFeature.SELECT_SOURCE,
+    ('water_heater', 'set_temperature'): WaterHeaterEntityFeature.TARGET_TEMPERATURE,
+    ('water_heater', 'set_operation_mode'): WaterHeaterEntityFeature.OPERATION_MODE,
+}
+
+
+class CommandTarget:
+    """An entity commands may be sent to."""
+
+    __slots__ = ('entity_id', 'domain', 'services', 'supported_features')
+
+    def __init__(self, entity_id: str, domain: str, services: set[str]) -> None:
+        """Initialize."""
+        self.entity_id = entity_id
+        self.domain = domain
+        # shared with every target of the domain and updated in place
+        self.services = services
+        # None until the entity has a state
+        self.supported_features: int | None = None
+
+
+class CommandIndex:
+    """Entity id to domain, services and supported features of the included entities.
+
+    Services are kept up to date from the service registered and removed
+    events, supported features from the state changes of the entities.
+    A command is refused when its service needs a feature the entity does
+    not support, see REQUIRED_FEATURES.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Initialize."""
+        self.hass = hass
+        self._targets: dict[str, CommandTarget] = {}
+        self._services: dict[str, set[str]] = {}
+        self._unsubs: list = []
+
+    def __len__(self) -> int:
+        return len(self._targets)
+
+    @callback
+    def async_setup(self, entity_ids: Iterable[str]) -> None:
+        for entity_id in entity_ids:
+            domain = split_entity_id(entity_id)[0]
+            if (services := self._services.get(domain)) is None:
+                services = self._services[domain] = set(
+                    self.hass.services.async_services_for_domain(domain))
+            self._targets[entity_id] = CommandTarget(entity_id, domain, services)
+        self.async_refresh()
+        self._unsubs = [
+            self.hass.bus.async_listen(EVENT_SERVICE_REGISTERED, self._on_service_event),
+            self.hass.bus.async_listen(EVENT_SERVICE_REMOVED, self._on_service_event),
+        ]
+
+    @callback
+    def async_stop(self) -> None:
+        for unsub in self._unsubs:
+            unsub()
+        self._unsubs = []
+
+    @callback
+    def _on_service_event(self, event: Event) -> None:
+        if (services := self._services.get(event.data[ATTR_DOMAIN])) is None:
+            return
+        if event.event_type == EVENT_SERVICE_REGISTERED:
+            services.add(event.data[ATTR_SERVICE])
+        else:
+            services.discard(event.data[ATTR_SERVICE])
+
+    @callback
+    def async_refresh(self) -> None:
+        """Read supported features from the current states, e.g. once HA has started."""
+        for entity_id, target in self._targets.items():
+            if (state := self.hass.states.get(entity_id)) is not None:
+                target.supported_features = state.attributes.get(ATTR_SUPPORTED_FEATURES, 0)
+
+    @callback
+    def update_state(self, state: State) -> None:
+        if (target := self._targets.get(state.entity_id)) is not None:
+            target.supported_features = state.attributes.get(ATTR_SUPPORTED_FEATURES, 0)
+
+    def validate(self, entity_id, service) -> tuple[CommandTarget | None, str | None]:
+        """Return the target of a command, or the error why it can not be run."""
+        if not isinstance(entity_id, str) or not isinstance(service, str):
+            return None, ERR_INVALID_COMMAND
+        if (target := self._targets.get(entity_id)) is None:
+            return None, ERR_UNKNOWN_ENTITY
+        if service not in target.services:
+            return None, ERR_UNKNOWN_SERVICE
+        if (target.supported_features is not None
+                and (required := REQUIRED_FEATURES.get((target.domain, service)))
+                and not target.supported_features & required):
+            return None, ERR_UNSUPPORTED_FEATURE
+        return target, None
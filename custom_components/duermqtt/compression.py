@@ -0,0 +1,33 @@
+"""Request body compression for uploads."""
+from __future__ import annotations
+
+import gzip
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ENCODING_ZSTD = 'zstd'
+ENCODING_GZIP = 'gzip'
+
+# in order of preference
+SUPPORTED_ENCODINGS = [ENCODING_ZSTD, ENCODING_GZIP] if zstandard else [ENCODING_GZIP]
+
+
+def select_encoding(accepted: list[str] | str | None) -> str | None:
+    """Pick the preferred encoding the server accepts."""
+    if isinstance(accepted, str):
+        accepted = [accepted]
+    if not accepted:
+        return None
+    for encoding in SUPPORTED_ENCODINGS:
+        if encoding in accepted:
+            return encoding
+    return None
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == ENCODING_ZSTD:
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return gzip.compress(data, compresslevel=6)
@@ -32,14 +32,47 @@ from .const import (
     CONF_FILTER,
     CONF_INCLUDE_DOMAINS,
     CONF_INCLUDE_ENTITIES,
+    CONF_BATCH_SIZE,
+    CONF_BATCH_INTERVAL,
+    CONF_FULL_ATTRIBUTES,
+    CONF_SYNC_WORKERS,
+    CONF_TRANSPORT,
+    CONF_REPORT_QOS,
+    CONF_REPORT_SYNCENTITY,
+    CONF_MIN_INTERVAL,
+    CONF_DOMAIN_MIN_INTERVALS,
+    CONF_OPTIMISTIC,
+    CONF_OVERFLOW_POLICY,
+    CONF_QUEUE_MAX_ITEMS,
+    CONF_QUEUE_MAX_KB,
+    CONF_RECONNECT_MIN,
+    CONF_RECONNECT_MAX,
+    OVERFLOW_POLICIES,
+    TRANSPORTS,
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_BATCH_INTERVAL,
+    DEFAULT_SYNC_WORKERS,
+    DEFAULT_TRANSPORT,
+    DEFAULT_REPORT_QOS,
+    DEFAULT_MIN_INTERVAL,
+    DEFAULT_OVERFLOW_POLICY,
+    DEFAULT_QUEUE_MAX_ITEMS,
+    DEFAULT_QUEUE_MAX_KB,
+    DEFAULT_RECONNECT_MIN,
+    DEFAULT_RECONNECT_MAX,
+    DEFAULT_DOMAIN_MIN_INTERVALS,
 )
+from .rate_limiter import parse_domain_intervals
+from .service import decode_token
 _LOGGER = logging.getLogger(__name__)
 CONF_ACTION = "action"
 CONF_EDIT_DEVICE = "edit_device"
 CONF_CHANGE_TOKEN = "change_token"
+CONF_EDIT_SYNC = "edit_sync"
 CONF_ACTIONS = {
     CONF_EDIT_DEVICE: "Edit a HA device",
     CONF_CHANGE_TOKEN: "Change Duer Platform Token",
+    CONF_EDIT_SYNC: "Edit state sync settings",
 }
 
 CONFIGURE_SCHEMA = vol.Schema(
@@ -182,7 +215,19 @@ class DuerConfigFlow(ConfigFlow, domain=DOMAIN):
         self, user_input: dict[str, Any] | None = None
     ):
         """Choose specific domains in bridge mode."""
+        errors = {}
         if user_input is not None:
+            try:
+                user = decode_token(user_input[CONF_TOKEN]).get('username')
+            except Exception as ex:
+                _LOGGER.error(f'token decode error: {ex}')
+                user = None
+            if not user:
+                errors[CONF_TOKEN] = "invalid_uid"
+        if user_input is not None and not errors:
+            # one entry per account, a second one would handle its commands again
+            await self.async_set_unique_id(user)
+            self._abort_if_unique_id_configured()
             self.duer_data[CONF_TOKEN] = user_input[CONF_TOKEN]
             self.duer_data[CONF_FILTER] = _make_entity_filter(
                 include_domains=[]
@@ -202,6 +247,7 @@ class DuerConfigFlow(ConfigFlow, domain=DOMAIN):
                     vol.Required(CONF_TOKEN): str,
                 }
             ),
+            errors=errors,
         )
 
     async def async_step_select_domain(
@@ -307,6 +353,102 @@ class OptionsFlowHandler(OptionsFlow):
             ),
         )
 
+    async def async_step_edit_sync(self, user_input=None):
+        """Edit state sync settings."""
+        errors = {}
+        if user_input is not None:
+            try:
+                parse_domain_intervals(
+                    user_input.get(CONF_DOMAIN_MIN_INTERVALS))
+            except ValueError:
+                errors[CONF_DOMAIN_MIN_INTERVALS] = "invalid_domain_intervals"
+            if user_input.get(CONF_RECONNECT_MAX, DEFAULT_RECONNECT_MAX) < user_input.get(
+                    CONF_RECONNECT_MIN, DEFAULT_RECONNECT_MIN):
+                errors[CONF_RECONNECT_MAX] = "invalid_reconnect_delays"
+            if not errors:
+                self.duer_options.update(user_input)
+                return self.async_create_entry(title="", data=self.duer_options)
+        options = {**self.duer_options, **(user_input or {})}
+        return self.async_show_form(
+            step_id="edit_sync",
+            data_schema=vol.Schema(
+                {
+                    vol.Required(
+                        CONF_BATCH_SIZE,
+                        default=options.get(
+                            CONF_BATCH_SIZE, DEFAULT_BATCH_SIZE),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=1, max=500)),
+                    vol.Required(
+                        CONF_BATCH_INTERVAL,
+                        default=options.get(
+                            CONF_BATCH_INTERVAL, DEFAULT_BATCH_INTERVAL),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=0, max=5000)),
+                    vol.Required(
+                        CONF_FULL_ATTRIBUTES,
+                        default=options.get(CONF_FULL_ATTRIBUTES, False),
+                    ): bool,
+                    vol.Required(
+                        CONF_SYNC_WORKERS,
+                        default=options.get(
+                            CONF_SYNC_WORKERS, DEFAULT_SYNC_WORKERS),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=1, max=16)),
+                    vol.Required(
+                        CONF_TRANSPORT,
+                        default=options.get(CONF_TRANSPORT, DEFAULT_TRANSPORT),
+                    ): vol.In(TRANSPORTS),
+                    vol.Required(
+                        CONF_REPORT_QOS,
+                        default=options.get(
+                            CONF_REPORT_QOS, DEFAULT_REPORT_QOS),
+                    ): vol.All(vol.Coerce(int), vol.In([0, 1])),
+                    vol.Required(
+                        CONF_REPORT_SYNCENTITY,
+                        default=options.get(CONF_REPORT_SYNCENTITY, False),
+                    ): bool,
+                    vol.Required(
+                        CONF_MIN_INTERVAL,
+                        default=options.get(
+                            CONF_MIN_INTERVAL, DEFAULT_MIN_INTERVAL),
+                    ): vol.All(vol.Coerce(float), vol.Range(min=0, max=300)),
+                    vol.Optional(
+                        CONF_DOMAIN_MIN_INTERVALS,
+                        default=options.get(
+                            CONF_DOMAIN_MIN_INTERVALS, DEFAULT_DOMAIN_MIN_INTERVALS),
+                    ): str,
+                    vol.Required(
+                        CONF_OPTIMISTIC,
+                        default=options.get(CONF_OPTIMISTIC, False),
+                    ): bool,
+                    vol.Required(
+                        CONF_OVERFLOW_POLICY,
+                        default=options.get(
+                            CONF_OVERFLOW_POLICY, DEFAULT_OVERFLOW_POLICY),
+                    ): vol.In(OVERFLOW_POLICIES),
+                    vol.Required(
+                        CONF_QUEUE_MAX_ITEMS,
+                        default=options.get(
+                            CONF_QUEUE_MAX_ITEMS, DEFAULT_QUEUE_MAX_ITEMS),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=0, max=100000)),
+                    vol.Required(
+                        CONF_QUEUE_MAX_KB,
+                        default=options.get(
+                            CONF_QUEUE_MAX_KB, DEFAULT_QUEUE_MAX_KB),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=0, max=65536)),
+                    vol.Required(
+                        CONF_RECONNECT_MIN,
+                        default=options.get(
+                            CONF_RECONNECT_MIN, DEFAULT_RECONNECT_MIN),
+                    ): vol.All(vol.Coerce(float), vol.Range(min=0.1, max=60)),
+                    vol.Required(
+                        CONF_RECONNECT_MAX,
+                        default=options.get(
+                            CONF_RECONNECT_MAX, DEFAULT_RECONNECT_MAX),
+                    ): vol.All(vol.Coerce(float), vol.Range(min=1, max=3600)),
+                }
+            ),
+            errors=errors,
+        )
+
     async def async_step_edit_domain(
         self, user_input: dict[str, Any] | None = None
     ):
@@ -344,6 +486,8 @@ class OptionsFlowHandler(OptionsFlow):
                 return await self.async_step_change_token()
             if user_input.get(CONF_ACTION) == CONF_EDIT_DEVICE:
                 return await self.async_step_edit_domain()
+            if user_input.get(CONF_ACTION) == CONF_EDIT_SYNC:
+                return await self.async_step_edit_sync()
 
         return self.async_show_form(
             step_id="init",
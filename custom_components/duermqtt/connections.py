@@ -0,0 +1,100 @@
+"""HTTP sessions and accounts shared by the config entries of the integration."""
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+from homeassistant.core import HomeAssistant
+
+from .const import HTTP_DNS_CACHE_TTL, HTTP_KEEPALIVE_TIMEOUT, HTTP_LIMIT_HEADROOM, HTTP_TIMEOUT
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def create_session(limit_per_host: int) -> ClientSession:
+    """Create an http session.
+
+    Every sync worker has at most one request in flight, limit_per_host
+    is the workers of the entries sharing the session plus headroom for
+    the version check and optimistic reports.
+    """
+    connector = TCPConnector(
+        ssl=False,
+        limit_per_host=limit_per_host,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+    )
+    return ClientSession(connector=connector, timeout=ClientTimeout(total=HTTP_TIMEOUT))
+
+
+async def _async_retire_session(session: ClientSession) -> None:
+    """Close a replaced session once the requests in flight on it have ended."""
+    try:
+        await asyncio.sleep(HTTP_TIMEOUT)
+    finally:
+        await session.close()
+
+
+class DuerConnections:
+    """Reference counted http sessions per web_url and the entry claiming each account.
+
+    Kept in hass.data[DOMAIN][DATA_CONNECTIONS], the last entry releasing a
+    session closes it. An account has one entry, a second entry of the
+    account is refused, so every entry keeps its own mqtt connection.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Initialize."""
+        self.hass = hass
+        self._sessions: dict[str, list] = {}
+        # account to the entry handling its commands
+        self._accounts: dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def claim_account(self, user: str, entry_id: str) -> str | None:
+        """Make entry_id the one entry handling the commands of user, return the entry already doing so."""
+        owner = self._accounts.setdefault(user, entry_id)
+        return None if owner == entry_id else owner
+
+    def release_account(self, user: str, entry_id: str) -> None:
+        if self._accounts.get(user) == entry_id:
+            del self._accounts[user]
+
+    def acquire_session(self, web_url: str, workers: int) -> ClientSession:
+        if (entry := self._sessions.get(web_url)) is None:
+            entry = self._sessions[web_url] = [None, 0, 0]
+        entry[1] += 1
+        entry[2] += workers
+        return self.session(web_url)
+
+    def session(self, web_url: str) -> ClientSession:
+        """The session of web_url, recreated if it was closed or the workers sharing it changed."""
+        entry = self._sessions[web_url]
+        limit = entry[2] + HTTP_LIMIT_HEADROOM
+        if entry[0] is None or entry[0].closed:
+            entry[0] = create_session(limit)
+        elif entry[0].connector.limit_per_host != limit:
+            _LOGGER.debug(f'resize http session of {web_url} to {limit} connections')
+            self.hass.async_create_background_task(
+                _async_retire_session(entry[0]), f'{web_url}_retire_session')
+            entry[0] = create_session(limit)
+        return entry[0]
+
+    async def async_release_session(self, web_url: str, workers: int) -> None:
+        if (entry := self._sessions.get(web_url)) is None:
+            return
+        entry[1] -= 1
+        entry[2] -= workers
+        if entry[1] <= 0:
+            del self._sessions[web_url]
+            if not entry[0].closed:
+                await entry[0].close()
+
+    def diagnostics(self) -> dict:
+        return {
+            'sessions': [{'entries': entry[1], 'workers': entry[2]}
+                         for entry in self._sessions.values()],
+        }
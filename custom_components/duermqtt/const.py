@@ -6,6 +6,7 @@ DOMAIN: Final = "duermqtt"
 CONST_VERSION: Final = '2024.4.1'
 
 # #### Config ####
+DATA_CONNECTIONS: Final = "connections"  # hass.data[DOMAIN] key of the shared connections
 CONF_TOKEN: Final = "uid"
 CONF_TOKEN: Final = "token"
 
@@ -48,11 +49,35 @@ MSG_ON: Final = "on"
 MSG_OFF: Final = "off"
 MSG_PAUSE: Final = "pause"  # for covers
 MSG_SPEED_COUNT: Final = 4  # for fans, 4 speed supported at most
+# acknowledgement of a callservice command carrying a request_id
+ACK_ACCEPTED: Final = "accepted"
+ACK_DONE: Final = "done"
+ACK_ERROR: Final = "error"
+ERR_INVALID_COMMAND: Final = "invalid_command"
+ERR_UNKNOWN_ENTITY: Final = "unknown_entity"
+ERR_UNKNOWN_SERVICE: Final = "unknown_service"
+ERR_UNSUPPORTED_FEATURE: Final = "unsupported_feature"  # the entity lacks the feature the service needs
+ERR_SERVICE_FAILED: Final = "service_failed"
+COMMAND_DEDUPE_SIZE: Final = 256  # request ids remembered to drop redelivered commands
+COMMAND_DEDUPE_TTL: Final = 300  # s
+OPTIMISTIC_TIMEOUT: Final = 5  # s to wait for the real state before correcting an optimistic report
 
 # #### Service Api ####
 CONST_GET_VERSION_CHECK_URL = '/api/plugin/config'
 CONST_POST_SYNC_DEVICE_URL = '/api/device/sync_entity_v1'
 CONST_POST_SYNC_STATE_URL = '/api/device/change_state'
+CONST_POST_SYNC_STATE_BATCH_URL = '/api/device/change_state_batch'
+# plugin config flags returned by CONST_GET_VERSION_CHECK_URL
+FEATURE_BATCH_STATE: Final = "batch_state"
+FEATURE_STATE_DELTA: Final = "state_delta"
+FEATURE_COMPRESSION: Final = "compression"  # list of accepted request encodings
+FEATURE_SYNC_PAGES: Final = "syncentity_pages"
+FEATURE_SYNC_FINGERPRINT: Final = "syncentity_fingerprint"  # implies syncentity_pages
+# answers to a batch upload meaning the server has no batch api, other errors are retried
+BATCH_UNSUPPORTED_CODES: Final = (404, 405, 501)
+# http answers worth retrying besides 5xx, 415 is retried uncompressed
+HTTP_RETRY_STATUSES: Final = (408, 415, 429)
+
 CONF_ENTITY_CONFIG = "entity_config"
 CONF_FILTER = "filter"
 CONF_INCLUDE_DOMAINS: Final = "include_domains"
@@ -60,6 +85,87 @@ CONF_INCLUDE_ENTITIES: Final = "include_entities"
 CONF_EXCLUDE_DOMAINS: Final = "exclude_domains"
 CONF_EXCLUDE_ENTITIES: Final = "exclude_entities"
 
+# #### Sync Options ####
+CONF_BATCH_SIZE: Final = "batch_size"
+CONF_BATCH_INTERVAL: Final = "batch_interval"  # ms
+CONF_FULL_ATTRIBUTES: Final = "full_attributes"  # send every attribute instead of the Duer subset
+CONF_SYNC_WORKERS: Final = "sync_workers"
+CONF_TRANSPORT: Final = "transport"
+CONF_REPORT_QOS: Final = "report_qos"
+CONF_REPORT_SYNCENTITY: Final = "report_syncentity"  # also publish syncentity on the report topic
+CONF_MIN_INTERVAL: Final = "min_interval"  # s between uploads of one entity
+CONF_DOMAIN_MIN_INTERVALS: Final = "domain_min_intervals"  # e.g. "climate=5, light=0.5"
+CONF_OPTIMISTIC: Final = "optimistic"  # report the expected state right after a command
+CONF_OVERFLOW_POLICY: Final = "overflow_policy"  # what to do when the sync queue is full
+CONF_QUEUE_MAX_ITEMS: Final = "queue_max_items"  # 0 for no limit
+CONF_QUEUE_MAX_KB: Final = "queue_max_kb"  # 0 for no limit
+CONF_RECONNECT_MIN: Final = "reconnect_min"  # s, first mqtt reconnect backoff
+CONF_RECONNECT_MAX: Final = "reconnect_max"  # s, backoff cap
+TRANSPORT_HTTP: Final = "http"
+TRANSPORT_MQTT: Final = "mqtt"
+TRANSPORTS: Final = [TRANSPORT_HTTP, TRANSPORT_MQTT]
+OVERFLOW_DROP_OLDEST: Final = "drop_oldest"
+OVERFLOW_DROP_NEWEST: Final = "drop_newest"
+OVERFLOW_KEEP_LATEST: Final = "keep_latest"  # oldest states move to the outbox, latest per entity
+OVERFLOW_BLOCK: Final = "block"  # hold new states until room is made or QUEUE_BLOCK_TIMEOUT
+OVERFLOW_POLICIES: Final = [OVERFLOW_KEEP_LATEST, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST, OVERFLOW_BLOCK]
+DEFAULT_BATCH_SIZE: Final = 50
+DEFAULT_BATCH_INTERVAL: Final = 200
+DEFAULT_SYNC_WORKERS: Final = 4
+DEFAULT_TRANSPORT: Final = TRANSPORT_HTTP
+DEFAULT_REPORT_QOS: Final = 1
+DEFAULT_MIN_INTERVAL: Final = 1.0
+DEFAULT_DOMAIN_MIN_INTERVALS: Final = ""
+DEFAULT_OVERFLOW_POLICY: Final = OVERFLOW_KEEP_LATEST
+DEFAULT_QUEUE_MAX_ITEMS: Final = 2000
+DEFAULT_QUEUE_MAX_KB: Final = 4096
+QUEUE_BLOCK_TIMEOUT: Final = 5  # s
+DEFAULT_RECONNECT_MIN: Final = 1.0
+DEFAULT_RECONNECT_MAX: Final = 120.0
+QUEUE_OVERFLOW_WARN_INTERVAL: Final = 60  # s between queue full warnings
+SYNC_LANE_WEIGHTS: Final = (4, 1)  # states of the interactive and the background lane per round
+INTERACTIVE_WINDOW: Final = 10  # s an entity stays interactive after a command
+
+# #### Significant change ####
+# numeric attribute changes smaller than these are not uploaded
+SIGNIFICANT_DEADBANDS: Final = {
+    "current_temperature": 0.1,
+    "temperature": 0.1,
+    "target_temp_high": 0.1,
+    "target_temp_low": 0.1,
+    "current_humidity": 1,
+    "humidity": 1,
+}
+
+# #### Outbox ####
+OUTBOX_RETRY_MIN: Final = 5  # s
+OUTBOX_RETRY_MAX: Final = 300  # s
+OUTBOX_FLUSH_TIMEOUT: Final = 10  # s, deadline to flush pending states on unload
+OUTBOX_COMPACT_RECORDS: Final = 500
+
+# #### Storage ####
+CATALOG_STORAGE_VERSION: Final = 1
+CATALOG_SAVE_DELAY: Final = 10  # s
+PLUGIN_STORAGE_VERSION: Final = 1
+VERSION_CHECK_TTL: Final = 86400  # s, reuse the cached plugin config for a day
+VERSION_CHECK_RETRY_MIN: Final = 30  # s
+VERSION_CHECK_RETRY_MAX: Final = 600  # s
+
+# #### Metrics ####
+METRICS_LATENCY_SAMPLES: Final = 200
+METRICS_SCAN_INTERVAL: Final = 30  # s
+METRICS_HISTOGRAM_BOUNDS: Final = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)  # ms
+
+# #### Http ####
+HTTP_TIMEOUT: Final = 30
+HTTP_KEEPALIVE_TIMEOUT: Final = 60
+HTTP_DNS_CACHE_TTL: Final = 300
+HTTP_LIMIT_HEADROOM: Final = 1  # connections per host on top of the sync workers
+COMPRESS_MIN_SIZE: Final = 1024  # bytes, smaller bodies are sent uncompressed
+COMPRESS_EXECUTOR_SIZE: Final = 65536  # bytes, larger bodies are compressed in the executor
+SYNC_PAGE_SIZE: Final = 200  # entities per syncentity page
+SYNC_PAGE_RETRIES: Final = 3
+
 
 CONFIG_OPTIONS = [
     CONF_FILTER,
@@ -0,0 +1,51 @@
+"""Bounded cache of recently handled command ids to drop redelivered commands."""
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+
+from .const import COMMAND_DEDUPE_SIZE, COMMAND_DEDUPE_TTL
+
+_PENDING = object()
+
+
+class CommandDedupeCache:
+    """LRU of command ids with the latest outcome of each, expiring ttl after last seen."""
+
+    def __init__(self, size: int = COMMAND_DEDUPE_SIZE, ttl: float = COMMAND_DEDUPE_TTL) -> None:
+        """Initialize."""
+        self._size = size
+        self._ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self.suppressed = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _expire(self, now: float) -> None:
+        while self._entries:
+            key, (at, _) = next(iter(self._entries.items()))
+            if now - at < self._ttl:
+                break
+            del self._entries[key]
+
+    def check(self, command_id: str) -> tuple[bool, dict | None]:
+        """Return whether the id was seen before and its cached outcome, and remember a new id."""
+        now = time.monotonic()
+        self._expire(now)
+        if (entry := self._entries.get(command_id)) is not None and now - entry[0] < self._ttl:
+            # refresh the time too, entries stay ordered by time for _expire
+            self._entries[command_id] = (now, entry[1])
+            self._entries.move_to_end(command_id)
+            self.suppressed += 1
+            outcome = entry[1]
+            return True, None if outcome is _PENDING else outcome
+        self._entries[command_id] = (now, _PENDING)
+        self._entries.move_to_end(command_id)
+        if len(self._entries) > self._size:
+            self._entries.popitem(last=False)
+        return False, None
+
+    def set_outcome(self, command_id: str, outcome: dict) -> None:
+        if (entry := self._entries.get(command_id)) is not None:
+            self._entries[command_id] = (entry[0], outcome)
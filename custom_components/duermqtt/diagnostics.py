@@ -0,0 +1,27 @@
+"""Diagnostics support for duermqtt."""
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_PASSWORD, CONF_TOKEN, CONF_USERNAME
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+from .service import DuerService
+
+TO_REDACT = {CONF_TOKEN, CONF_PASSWORD, CONF_USERNAME, 'mqtt_url', 'web_url'}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    diagnostics: dict[str, Any] = {
+        'entry': async_redact_data(entry.as_dict(), TO_REDACT),
+    }
+    data = hass.data.get(DOMAIN, {}).get(entry.entry_id)
+    if data is not None and isinstance(service := data.get('service'), DuerService):
+        diagnostics['service'] = async_redact_data(service.diagnostics(), TO_REDACT)
+    return diagnostics
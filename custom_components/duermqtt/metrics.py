@@ -0,0 +1,100 @@
+"""In memory metrics of the bridge, cheap enough to update on every message."""
+from __future__ import annotations
+
+import time
+from collections import deque
+from datetime import datetime
+
+from homeassistant.util import dt as dt_util
+
+from .const import METRICS_HISTOGRAM_BOUNDS, METRICS_LATENCY_SAMPLES
+
+_RATE_WINDOW = 60  # s
+
+
+class LatencyWindow:
+    """The most recent latency samples in ms."""
+
+    def __init__(self, size: int = METRICS_LATENCY_SAMPLES) -> None:
+        """Initialize."""
+        self._samples: deque[float] = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, latency_ms: float) -> None:
+        self._samples.append(latency_ms)
+
+    def percentile(self, percent: float) -> float | None:
+        if not self._samples:
+            return None
+        samples = sorted(self._samples)
+        index = min(len(samples) - 1, int(len(samples) * percent / 100))
+        return round(samples[index], 1)
+
+    def histogram(self, bounds: tuple[float, ...] = METRICS_HISTOGRAM_BOUNDS) -> dict[str, int]:
+        """Count samples per bucket, keyed by the upper bound in ms."""
+        counts = dict.fromkeys([f'<={bound}' for bound in bounds] + [f'>{bounds[-1]}'], 0)
+        for sample in self._samples:
+            bucket = next((bound for bound in bounds if sample <= bound), None)
+            counts[f'>{bounds[-1]}' if bucket is None else f'<={bucket}'] += 1
+        return counts
+
+
+class DuerMetrics:
+    """State sync metrics."""
+
+    def __init__(self) -> None:
+        """Initialize."""
+        self.queue_depth_peak = 0
+        self.post_latency = LatencyWindow()
+        self.command_latency = LatencyWindow()
+        # time states waited in the sync queues, per lane
+        self.queue_delay = (LatencyWindow(), LatencyWindow())
+        self.uploaded = 0
+        self.failed = 0
+        # states the server refused, dropped without retry
+        self.rejected = 0
+        self._uploads: deque[tuple[float, int]] = deque()
+
+    def record_queue_depth(self, depth: int) -> None:
+        if depth > self.queue_depth_peak:
+            self.queue_depth_peak = depth
+
+    def record_upload(self, count: int, ok: bool) -> None:
+        if not ok:
+            self.failed += count
+            return
+        self.uploaded += count
+        now = time.monotonic()
+        self._uploads.append((now, count))
+        while self._uploads and self._uploads[0][0] < now - _RATE_WINDOW:
+            self._uploads.popleft()
+
+    @property
+    def uploads_per_minute(self) -> int:
+        threshold = time.monotonic() - _RATE_WINDOW
+        return sum(count for at, count in self._uploads if at >= threshold)
+
+
+class MqttMetrics:
+    """MQTT connection metrics."""
+
+    def __init__(self) -> None:
+        """Initialize."""
+        self.messages_in = 0
+        self.messages_out = 0
+        self.connects = 0
+        self.last_connected: datetime | None = None
+        # ms from the start of a reconnect attempt until its CONNACK or failure
+        self.reconnect_duration = LatencyWindow()
+        # s from the loss of the connection until it was back
+        self.last_outage: float | None = None
+
+    @property
+    def reconnects(self) -> int:
+        return max(self.connects - 1, 0)
+
+    def record_connect(self) -> None:
+        self.connects += 1
+        self.last_connected = dt_util.utcnow()
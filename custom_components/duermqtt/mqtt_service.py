@@ -4,6 +4,7 @@ import asyncio
 import contextlib
 import logging
 import json
+import random
 import uuid
 import time
 from time import strftime, localtime
@@ -12,15 +13,18 @@ import socket
 import paho.mqtt.client as mqtt
 from paho.mqtt.client import Client, Properties, MQTTMessage, MQTTv31, MQTTv311, MQTTv5
 from .async_mqtt_client import AsyncMQTTClient
+from .metrics import MqttMetrics
 from asyncio import Task
 from homeassistant.core import HomeAssistant, State, Event, callback
 from homeassistant.helpers.event import async_track_state_change_event
+from homeassistant.util.json import json_loads
 
 from .const import (
     TOPIC_COMMAND,
+    DEFAULT_RECONNECT_MIN,
+    DEFAULT_RECONNECT_MAX,
 )
 TOPIC_COMMAND = 'ha2xiaodu/command/'
-TOPIC_COMMAND = 'ha2xiaodu/report/'
 TOPIC_PING = 'topic_ping'
 _LOGGER = logging.getLogger(__name__)
 
@@ -59,7 +63,15 @@ class DuerMqttService:
         self._connection_lock = asyncio.Lock()
         self._misc_loop_task: Task = None
         self._reconnect_loop_task: Task = None
+        self._reconnect_timer: asyncio.TimerHandle = None
+        self._reconnect_min: float = DEFAULT_RECONNECT_MIN
+        self._reconnect_max: float = DEFAULT_RECONNECT_MAX
+        self._reconnect_attempt = 0
+        self._attempt_started: float = None
+        self._disconnected_at: float = None
+        self._stop_mqtt = False
         self._misc_timer: asyncio.TimerHandle = None
+        self.metrics = MqttMetrics()
 
     def _reg_state_change_event(self):
         @callback
@@ -88,30 +100,45 @@ class DuerMqttService:
         _LOGGER.debug('Connected to MQTT broker!')
 
         _LOGGER.debug(f"Connected to MQTT broker! {mqtt.connack_string(rc)}")
+        if rc != mqtt.CONNACK_ACCEPTED:
+            # the broker closes the socket, which schedules the next attempt
+            _LOGGER.warning(f'mqtt connection refused: {mqtt.connack_string(rc)}')
+            return
+        self.metrics.record_connect()
+        now = time.monotonic()
+        if self._attempt_started is not None:
+            self.metrics.reconnect_duration.add((now - self._attempt_started) * 1000)
+            self._attempt_started = None
+        if self._disconnected_at is not None:
+            self.metrics.last_outage = round(now - self._disconnected_at, 1)
+            self._disconnected_at = None
+        # a successful CONNACK starts the backoff over
+        self._reconnect_attempt = 0
+        self._async_cancel_reconnect()
         self.update_connect_state(True)
         _LOGGER.debug(f'reg state change callback {self.entity_list}')
         # self._hass.add_job(self._reg_state_change_event)
         # self._reg_state_change_event()
-        self._reconnect_loop_task = self._hass.async_create_background_task(
-            self._reconnect_loop(), name=f"{self.host}_mqtt_reconnect_loop"
-        )
         self._client.subscribe(
             f'{TOPIC_COMMAND}{self.username}', 0)
 
     @callback
     def _handle_on_disconnect(self, client, packet, exc=None) -> None:
         _LOGGER.warning("Disconnected from %s:%s", self.host, self.port)
+        self.connected = False
         try:
             for cb in self.on_connect_cb_list:
                 if callable(cb):
                     cb(False)
         except Exception as ex:
             _LOGGER.error(f'disconn cb error: {ex}')
+        self._schedule_reconnect()
 
     @callback
     def _handle_on_message(self, client: Client, userData: None, msg: MQTTMessage):
         try:
-            msg_dic = json.loads(msg.payload.decode())
+            self.metrics.messages_in += 1
+            msg_dic = json_loads(msg.payload)
             _LOGGER.debug(f'receive msg: {msg_dic}')
             for cb in self.on_message_cb_list:
                 if callable(cb):
@@ -158,6 +185,7 @@ class DuerMqttService:
             self._misc_timer = None
         if fileno > -1:
             self._loop.remove_reader(sock)
+        self._schedule_reconnect()
 
     def _on_socket_register_write(
         self, client: mqtt.Client, userdata, sock
@@ -205,10 +233,10 @@ class DuerMqttService:
 
     @callback
     def _async_cancel_reconnect(self) -> None:
-        """Cancel the reconnect task."""
-        if self._reconnect_loop_task:
-            self._reconnect_loop_task.cancel()
-            self._reconnect_loop_task = None
+        """Cancel a scheduled reconnect."""
+        if self._reconnect_timer:
+            self._reconnect_timer.cancel()
+            self._reconnect_timer = None
 
     # @callback
     # async def _misc_loop(self):
@@ -225,19 +253,45 @@ class DuerMqttService:
     #         await asyncio.sleep(1)
     #     # _LOGGER.debug("Misc MQTT loop is finished")
 
-    async def _reconnect_loop(self) -> None:
-        """Reconnect to the MQTT server."""
-        while True:
-            if not self.connected:
-                try:
-                    async with self._connection_lock, self._async_connect_in_executor():
-                        await self._hass.async_add_executor_job(self._client.reconnect)
-                except OSError as err:
-                    _LOGGER.debug(
-                        f"Error re-connecting to MQTT server due to exception: {err}"
-                    )
-            _LOGGER.debug('check reconnect loop invoke')
-            await asyncio.sleep(60)
+    @callback
+    def _schedule_reconnect(self) -> None:
+        """Schedule a reconnect with exponential backoff and full jitter."""
+        if self._stop_mqtt or self._client is None or self._reconnect_timer is not None:
+            return
+        if self._reconnect_loop_task is not None and not self._reconnect_loop_task.done():
+            return
+        if self._disconnected_at is None:
+            self._disconnected_at = time.monotonic()
+        cap = min(self._reconnect_max, self._reconnect_min * 2 ** self._reconnect_attempt)
+        delay = random.uniform(0, cap)
+        self._reconnect_attempt += 1
+        _LOGGER.debug(f'reconnect attempt {self._reconnect_attempt} in {delay:.1f}s')
+        self._reconnect_timer = self._loop.call_later(delay, self._start_reconnect)
+
+    @callback
+    def _start_reconnect(self) -> None:
+        self._reconnect_timer = None
+        if self._stop_mqtt or self.connected:
+            return
+        self._reconnect_loop_task = self._hass.async_create_background_task(
+            self._async_reconnect(), name=f"{self.host}_mqtt_reconnect"
+        )
+
+    async def _async_reconnect(self) -> None:
+        """Reconnect to the MQTT server, the next attempt is scheduled when it fails."""
+        self._attempt_started = time.monotonic()
+        try:
+            async with self._connection_lock, self._async_connect_in_executor():
+                await self._hass.async_add_executor_job(self._client.reconnect)
+        except OSError as err:
+            _LOGGER.debug(
+                f"Error re-connecting to MQTT server due to exception: {err}"
+            )
+            self.metrics.reconnect_duration.add(
+                (time.monotonic() - self._attempt_started) * 1000)
+            self._attempt_started = None
+            self._reconnect_loop_task = None
+            self._schedule_reconnect()
 
     @callback
     async def connect(self, url, port, user, pwd,
@@ -252,7 +306,9 @@ class DuerMqttService:
                       tls_version=ssl.PROTOCOL_TLSv1_2,
                       ciphers=None,
                       state_key="state",
-                      notify_birth=False) -> None:
+                      notify_birth=False,
+                      reconnect_min=DEFAULT_RECONNECT_MIN,
+                      reconnect_max=DEFAULT_RECONNECT_MAX) -> None:
         _LOGGER.debug('start set mqtt client')
         self.host = url
         self.port = int(port)
@@ -267,6 +323,8 @@ class DuerMqttService:
         self.tls_version = tls_version
         self.ciphers = ciphers
         self.reconnect_interval = reconnect_interval
+        self._reconnect_min = reconnect_min
+        self._reconnect_max = max(reconnect_max, reconnect_min)
         self.keep_alive = keep_alive
         self._stop_mqtt = False
         self.client_id = user or mqtt.base62(uuid.uuid4().int, padding=22)
@@ -303,6 +361,7 @@ class DuerMqttService:
         _LOGGER.debug(
             f'start conn {type(self.host)} {type(self.port)} {type(self.keep_alive)}')
         # self._client.connect(self.host, self.port, self.keep_alive)
+        res = None
         try:
             async with self._connection_lock, self._async_connect_in_executor():
                 res = await self._hass.async_add_executor_job(self._client.connect, self.host, self.port, self.keep_alive)
@@ -313,14 +372,18 @@ class DuerMqttService:
                 if res != 0:
                     _LOGGER.error(
                         f'mqtt create connect error: {mqtt.error_string(res)}')
+        if res != mqtt.MQTT_ERR_SUCCESS:
+            self._schedule_reconnect()
+            return
         self._client.socket().setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 2048)
         _LOGGER.debug('mqtt client init finish')
 
     def stop(self):
         _LOGGER.info("mqtt stopping")
         # mqtt broker will send last will since brake of unexpectedly
-        self._stop_mqtt = False
-        sock = self._client.socket()
+        self._stop_mqtt = True
+        self._async_cancel_reconnect()
+        sock = self._client.socket() if self._client is not None else None
         if sock is not None:
             sock.close()
         if isinstance(self._reconnect_loop_task, Task):
@@ -328,10 +391,13 @@ class DuerMqttService:
                 self._reconnect_loop_task.cancel()
         _LOGGER.info("mqtt stopped")
 
-    def publish(self, topic, payload, **kwargs):
+    def publish(self, topic, payload, **kwargs) -> bool:
         _LOGGER.debug(f'pub topic {topic}')
         if self.connected:
-            self._client.publish(topic, payload, **kwargs)
+            info = self._client.publish(topic, payload, **kwargs)
+            self.metrics.messages_out += 1
+            return info.rc == mqtt.MQTT_ERR_SUCCESS
+        return False
 
     def subscribe(self, *args, **kwargs):
         if self.connected:
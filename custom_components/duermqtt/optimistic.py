@@ -0,0 +1,133 @@
+"""Expected states reported right after a command, reconciled with the real ones."""
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Callable
+
+from homeassistant.const import (
+    STATE_CLOSED,
+    STATE_CLOSING,
+    STATE_OFF,
+    STATE_ON,
+    STATE_OPEN,
+    STATE_OPENING,
+)
+from homeassistant.core import HomeAssistant, State, callback
+
+from .const import OPTIMISTIC_TIMEOUT
+
+_ON_OFF_DOMAINS = ('light', 'switch', 'fan', 'input_boolean', 'humidifier', 'media_player')
+# states passed through on the way to an expected state
+_TRANSITIONS = {STATE_OPEN: STATE_OPENING, STATE_CLOSED: STATE_CLOSING}
+
+
+def expected_state(domain: str, service: str, service_data: dict, current: State | None) -> State | None:
+    """The state a command is expected to lead to, None when it can not be predicted."""
+    if current is None:
+        return None
+    state = None
+    attributes: dict = {}
+    if domain in _ON_OFF_DOMAINS:
+        if service == 'turn_on':
+            state = STATE_ON
+            if domain == 'light':
+                if isinstance(brightness := service_data.get('brightness'), (int, float)):
+                    attributes['brightness'] = int(brightness)
+                elif isinstance(pct := service_data.get('brightness_pct'), (int, float)):
+                    attributes['brightness'] = round(255 * pct / 100)
+        elif service == 'turn_off':
+            state = STATE_OFF
+        elif service == 'toggle' and current.state in (STATE_ON, STATE_OFF):
+            state = STATE_OFF if current.state == STATE_ON else STATE_ON
+    elif domain == 'cover':
+        if service == 'open_cover':
+            state = STATE_OPEN
+        elif service == 'close_cover':
+            state = STATE_CLOSED
+        elif service == 'set_cover_position' and isinstance(
+                position := service_data.get('position'), (int, float)):
+            state = STATE_OPEN if position > 0 else STATE_CLOSED
+            attributes['current_position'] = int(position)
+    if state is None:
+        return None
+    return State(current.entity_id, state, {**current.attributes, **attributes})
+
+
+def _matches(expected: State, actual: State) -> bool:
+    if expected.state != actual.state:
+        return False
+    for key in ('brightness', 'current_position'):
+        if (value := expected.attributes.get(key)) is None:
+            continue
+        actual_value = actual.attributes.get(key)
+        # brightness_pct does not map exactly onto 0..255
+        if not isinstance(actual_value, (int, float)) or abs(actual_value - value) > 1:
+            return False
+    return True
+
+
+class OptimisticStates:
+    """Expected states waiting for the real state of their entity.
+
+    When the real state differs from the expected one, or none arrives
+    within OPTIMISTIC_TIMEOUT, correct is called with the entity id so
+    the real state is reported. A state on the way to the expected one,
+    e.g. opening for open, keeps the expectation and restarts the timeout.
+    """
+
+    def __init__(self, hass: HomeAssistant, correct: Callable[[str], None],
+                 timeout: float = OPTIMISTIC_TIMEOUT) -> None:
+        """Initialize."""
+        self._loop = hass.loop
+        self._correct = correct
+        self._timeout = timeout
+        self._pending: dict[str, tuple[State, asyncio.TimerHandle]] = {}
+        self.corrections = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    @callback
+    def expect(self, state: State) -> None:
+        if (pending := self._pending.get(state.entity_id)) is not None:
+            pending[1].cancel()
+        self._pending[state.entity_id] = (
+            state, self._loop.call_later(self._timeout, self._expire, state.entity_id))
+
+    @callback
+    def reconcile(self, state: State) -> bool | None:
+        """Whether the real state matches the expected one.
+
+        None when nothing was expected or the entity is still on its way.
+        """
+        if (pending := self._pending.pop(state.entity_id, None)) is None:
+            return None
+        pending[1].cancel()
+        if _TRANSITIONS.get(pending[0].state) == state.state:
+            self.expect(pending[0])
+            return None
+        if _matches(pending[0], state):
+            return True
+        self.corrections += 1
+        return False
+
+    @callback
+    def reconcile_failed(self, entity_id: str) -> bool:
+        """Drop the expected state of an entity whose command failed, whether one was pending."""
+        if (pending := self._pending.pop(entity_id, None)) is None:
+            return False
+        pending[1].cancel()
+        self.corrections += 1
+        return True
+
+    @callback
+    def _expire(self, entity_id: str) -> None:
+        if self._pending.pop(entity_id, None) is not None:
+            self.corrections += 1
+            self._correct(entity_id)
+
+    @callback
+    def clear(self) -> None:
+        for _, timer in self._pending.values():
+            timer.cancel()
+        self._pending.clear()
@@ -0,0 +1,130 @@
+"""Durable outbox for state uploads that could not be delivered."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from collections.abc import Iterable
+
+from homeassistant.core import HomeAssistant, State
+from homeassistant.helpers.json import json_dumps
+from homeassistant.util.json import json_loads
+
+from .const import OUTBOX_COMPACT_RECORDS
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class StateOutbox:
+    """Append-only file of states waiting for upload.
+
+    Every line is either a state record {"entity_id", "state"} or a sent
+    marker {"entity_id"}. Only the latest record per entity is kept in
+    memory, and the file is rewritten with just those once it holds too
+    many stale records.
+    """
+
+    def __init__(self, hass: HomeAssistant, path: str) -> None:
+        """Initialize."""
+        self.hass = hass
+        self._path = path
+        self._pending: dict[str, dict] = {}
+        self._records = 0
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def states(self) -> list[State]:
+        """States to retry, the current state of an entity wins over the stored one."""
+        states = []
+        for entity_id, data in self._pending.items():
+            state = self.hass.states.get(entity_id)
+            if state is None:
+                try:
+                    state = State.from_dict(data)
+                except Exception as ex:
+                    _LOGGER.warning(f'drop invalid outbox state {entity_id}: {ex}')
+            if isinstance(state, State):
+                states.append(state)
+        return states
+
+    async def async_load(self) -> None:
+        async with self._lock:
+            try:
+                self._pending = await self.hass.async_add_executor_job(self._load)
+                if self._records:
+                    # start from a compacted file without stale or torn records
+                    records = [json_dumps({'entity_id': entity_id, 'state': data})
+                               for entity_id, data in self._pending.items()]
+                    await self.hass.async_add_executor_job(self._compact, records)
+                    self._records = len(records)
+            except OSError as ex:
+                _LOGGER.error(f'load outbox err:{ex}')
+        if self._pending:
+            _LOGGER.debug(f'outbox loaded {len(self._pending)} states')
+
+    async def async_add(self, states: Iterable[State]) -> None:
+        lines = []
+        for state in states:
+            data = state.as_dict()
+            self._pending[state.entity_id] = data
+            lines.append(json_dumps(
+                {'entity_id': state.entity_id, 'state': data}))
+        await self._async_write(lines)
+
+    async def async_remove(self, entity_ids: Iterable[str]) -> None:
+        lines = []
+        for entity_id in entity_ids:
+            if self._pending.pop(entity_id, None) is not None:
+                lines.append(json_dumps({'entity_id': entity_id}))
+        await self._async_write(lines)
+
+    async def _async_write(self, lines: list[str]) -> None:
+        if not lines:
+            return
+        async with self._lock:
+            self._records += len(lines)
+            try:
+                if (not self._pending
+                        or self._records > max(OUTBOX_COMPACT_RECORDS, 2 * len(self._pending))):
+                    records = [json_dumps({'entity_id': entity_id, 'state': data})
+                               for entity_id, data in self._pending.items()]
+                    await self.hass.async_add_executor_job(self._compact, records)
+                    self._records = len(records)
+                else:
+                    await self.hass.async_add_executor_job(self._append, lines)
+            except OSError as ex:
+                _LOGGER.error(f'write outbox err:{ex}')
+
+    def _load(self) -> dict[str, dict]:
+        pending: dict[str, dict] = {}
+        if not os.path.exists(self._path):
+            return pending
+        with open(self._path, encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json_loads(line)
+                except ValueError:
+                    # torn write of the last line
+                    continue
+                self._records += 1
+                if 'state' in record:
+                    pending[record['entity_id']] = record['state']
+                else:
+                    pending.pop(record.get('entity_id'), None)
+        return pending
+
+    def _append(self, lines: list[str]) -> None:
+        with open(self._path, 'a', encoding='utf-8') as file:
+            file.write('\n'.join(lines) + '\n')
+
+    def _compact(self, records: list[str]) -> None:
+        if not records:
+            if os.path.exists(self._path):
+                os.remove(self._path)
+            return
+        tmp_path = f'{self._path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write('\n'.join(records) + '\n')
+        os.replace(tmp_path, self._path)
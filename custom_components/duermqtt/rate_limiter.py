@@ -0,0 +1,92 @@
+"""Per entity rate limit of state uploads."""
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Callable
+
+from homeassistant.core import HomeAssistant, State, callback, split_entity_id
+
+
+def parse_domain_intervals(value: str | None) -> dict[str, float]:
+    """Parse 'climate=5, light=0.5' into {'climate': 5.0, 'light': 0.5}."""
+    intervals: dict[str, float] = {}
+    for item in (value or '').split(','):
+        if not item.strip():
+            continue
+        domain, sep, interval = item.partition('=')
+        if not sep or not domain.strip():
+            raise ValueError(f'invalid domain interval: {item.strip()}')
+        intervals[domain.strip()] = float(interval)
+    return intervals
+
+
+class StateRateLimiter:
+    """Deliver at most one state per entity every min interval.
+
+    The first state after a quiet period is delivered at once. States
+    arriving within the interval are held back, a newer one replacing an
+    older one, and the last of them is delivered when the interval ends.
+    """
+
+    def __init__(self, hass: HomeAssistant, deliver: Callable[[State], None],
+                 min_interval: float = 0, domain_intervals: dict[str, float] | None = None) -> None:
+        """Initialize."""
+        self._loop = hass.loop
+        self._deliver = deliver
+        self._min_interval = min_interval
+        self._domain_intervals = domain_intervals or {}
+        self._last_delivered: dict[str, float] = {}
+        self._trailing: dict[str, State] = {}
+        self._timers: dict[str, asyncio.TimerHandle] = {}
+        self.suppressed = 0
+
+    def interval(self, entity_id: str) -> float:
+        return self._domain_intervals.get(split_entity_id(entity_id)[0], self._min_interval)
+
+    @callback
+    def process(self, state: State) -> None:
+        entity_id = state.entity_id
+        interval = self.interval(entity_id)
+        if interval <= 0:
+            self._deliver(state)
+            return
+        now = self._loop.time()
+        last = self._last_delivered.get(entity_id)
+        if entity_id not in self._timers and (last is None or now - last >= interval):
+            self._last_delivered[entity_id] = now
+            self._deliver(state)
+            return
+        if entity_id in self._trailing:
+            self.suppressed += 1
+        self._trailing[entity_id] = state
+        if entity_id not in self._timers:
+            self._timers[entity_id] = self._loop.call_at(
+                last + interval, self._deliver_trailing, entity_id)
+
+    @callback
+    def _deliver_trailing(self, entity_id: str) -> None:
+        self._timers.pop(entity_id, None)
+        if (state := self._trailing.pop(entity_id, None)) is not None:
+            self._last_delivered[entity_id] = self._loop.time()
+            self._deliver(state)
+
+    @callback
+    def deliver_now(self, state: State) -> None:
+        """Deliver a state at once, dropping the older state held back for its entity."""
+        entity_id = state.entity_id
+        if (timer := self._timers.pop(entity_id, None)) is not None:
+            timer.cancel()
+        if self._trailing.pop(entity_id, None) is not None:
+            self.suppressed += 1
+        self._last_delivered[entity_id] = self._loop.time()
+        self._deliver(state)
+
+    @callback
+    def flush(self) -> None:
+        """Deliver all held back states now."""
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        trailing, self._trailing = self._trailing, {}
+        for state in trailing.values():
+            self._deliver(state)
@@ -0,0 +1,160 @@
+import logging
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any
+
+from homeassistant.components.sensor import (
+    SensorDeviceClass,
+    SensorEntity,
+    SensorEntityDescription,
+    SensorStateClass,
+)
+from homeassistant.const import EntityCategory, UnitOfTime
+from homeassistant.core import HomeAssistant
+from . import DOMAIN, ConfigEntry
+from .const import METRICS_SCAN_INTERVAL
+from .service import DuerService
+from .sync_queue import LANE_BACKGROUND, LANE_INTERACTIVE
+
+_LOGGER = logging.getLogger(__name__)
+SCAN_INTERVAL = timedelta(seconds=METRICS_SCAN_INTERVAL)
+
+
+@dataclass(frozen=True, kw_only=True)
+class DuerSensorEntityDescription(SensorEntityDescription):
+    value_fn: Callable[[DuerService], Any]
+
+
+SENSORS: tuple[DuerSensorEntityDescription, ...] = (
+    DuerSensorEntityDescription(
+        key="sync_queue_depth",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda service: service.queue_depth,
+    ),
+    DuerSensorEntityDescription(
+        key="sync_queue_depth_peak",
+        value_fn=lambda service: service.metrics.queue_depth_peak,
+    ),
+    DuerSensorEntityDescription(
+        key="upload_latency_p50",
+        device_class=SensorDeviceClass.DURATION,
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda service: service.metrics.post_latency.percentile(50),
+    ),
+    DuerSensorEntityDescription(
+        key="upload_latency_p95",
+        device_class=SensorDeviceClass.DURATION,
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda service: service.metrics.post_latency.percentile(95),
+    ),
+    DuerSensorEntityDescription(
+        key="queue_delay_interactive_p95",
+        device_class=SensorDeviceClass.DURATION,
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda service: service.metrics.queue_delay[LANE_INTERACTIVE].percentile(95),
+    ),
+    DuerSensorEntityDescription(
+        key="queue_delay_background_p95",
+        device_class=SensorDeviceClass.DURATION,
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda service: service.metrics.queue_delay[LANE_BACKGROUND].percentile(95),
+    ),
+    DuerSensorEntityDescription(
+        key="uploads_per_minute",
+        native_unit_of_measurement="updates/min",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda service: service.metrics.uploads_per_minute,
+    ),
+    DuerSensorEntityDescription(
+        key="dropped_updates",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda service: service.dropped_updates,
+    ),
+    DuerSensorEntityDescription(
+        key="overflowed_updates",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda service: service.overflowed_updates,
+    ),
+    DuerSensorEntityDescription(
+        key="failed_updates",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda service: service.metrics.failed,
+    ),
+    DuerSensorEntityDescription(
+        key="filtered_updates",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda service: service.filtered_updates,
+    ),
+    DuerSensorEntityDescription(
+        key="duplicate_commands",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda service: service.duplicate_commands,
+    ),
+    DuerSensorEntityDescription(
+        key="mqtt_messages_in",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda service: service.mqtt_metrics.messages_in,
+    ),
+    DuerSensorEntityDescription(
+        key="mqtt_messages_out",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda service: service.mqtt_metrics.messages_out,
+    ),
+    DuerSensorEntityDescription(
+        key="mqtt_reconnects",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda service: service.mqtt_metrics.reconnects,
+    ),
+    DuerSensorEntityDescription(
+        key="mqtt_reconnect_duration_p95",
+        device_class=SensorDeviceClass.DURATION,
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda service: service.mqtt_metrics.reconnect_duration.percentile(95),
+    ),
+    DuerSensorEntityDescription(
+        key="mqtt_last_outage",
+        device_class=SensorDeviceClass.DURATION,
+        native_unit_of_measurement=UnitOfTime.SECONDS,
+        value_fn=lambda service: service.mqtt_metrics.last_outage,
+    ),
+    DuerSensorEntityDescription(
+        key="mqtt_last_connected",
+        device_class=SensorDeviceClass.TIMESTAMP,
+        value_fn=lambda service: service.mqtt_metrics.last_connected,
+    ),
+)
+
+
+async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry, async_add_entities):
+    domain = hass.data.get(DOMAIN)
+    if domain:
+        service: DuerService = domain.get(
+            config_entry.entry_id)["service"]
+        if isinstance(service, DuerService):
+            async_add_entities([
+                DuerMetricSensor(service, config_entry.entry_id, description)
+                for description in SENSORS
+            ])
+
+
+class DuerMetricSensor(SensorEntity):
+    """Diagnostic sensor polling one bridge metric."""
+
+    entity_description: DuerSensorEntityDescription
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    def __init__(self, service: DuerService, entry_id: str, description: DuerSensorEntityDescription):
+        self._gateway = service
+        self.entity_description = description
+        self._attr_name = f'duer_{description.key}'
+        self._attr_unique_id = f"sensor_{entry_id}_{description.key}"
+
+    @property
+    def native_value(self):
+        return self.entity_description.value_fn(self._gateway)
@@ -4,51 +4,245 @@ from __future__ import annotations
 import logging
 import asyncio
 from datetime import datetime
-from asyncio import Task, Lock, Queue
-from homeassistant.const import EVENT_HOMEASSISTANT_STARTED
-from homeassistant.core import CoreState, Event, HomeAssistant, State, callback
+from asyncio import Task, Lock
+from homeassistant.const import EVENT_HOMEASSISTANT_STARTED, EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import CoreState, Event, HomeAssistant, State, callback, split_entity_id
 from homeassistant.helpers.event import async_track_state_change_event
-from homeassistant.helpers.aiohttp_client import async_create_clientsession
+from homeassistant.helpers.storage import STORAGE_DIR, Store
+from homeassistant.helpers.json import json_bytes, json_dumps_sorted
+from homeassistant.util import dt as dt_util
+from homeassistant.util.json import json_loads
 import base64
 import json
-from aiohttp import ClientSession, ClientResponse
+import math
+import os
+import time
+import uuid
+import zlib
+from collections import Counter
+from collections.abc import Iterator
+from aiohttp import ClientSession, ClientResponse, ClientResponseError
 from .mqtt_service import DuerMqttService
+from .connections import DuerConnections
+from .sync_queue import LANE_BACKGROUND, LANE_INTERACTIVE, PendingStateQueue
+from .outbox import StateOutbox
+from .compression import compress, select_encoding
+from .catalog import EntityCatalog, catalog_fingerprint, entity_hash
+from .rate_limiter import StateRateLimiter, parse_domain_intervals
+from .state_filter import SignificantStateFilter
+from .metrics import DuerMetrics, MqttMetrics
+from .dedupe import CommandDedupeCache
+from .command_index import CommandIndex, CommandTarget
+from .optimistic import OptimisticStates, expected_state
+from .state_encoder import (
+    StateDeltaEncoder,
+    encode_entity_json,
+    encode_state,
+    encode_state_json,
+    json_array,
+)
 from . import DOMAIN
-from . const import CONST_POST_SYNC_DEVICE_URL, CONST_POST_SYNC_STATE_URL, CONST_GET_VERSION_CHECK_URL, CONST_VERSION
+from . const import (
+    CONST_POST_SYNC_DEVICE_URL,
+    CONST_POST_SYNC_STATE_URL,
+    CONST_POST_SYNC_STATE_BATCH_URL,
+    CONST_GET_VERSION_CHECK_URL,
+    CONST_VERSION,
+    FEATURE_BATCH_STATE,
+    FEATURE_STATE_DELTA,
+    FEATURE_COMPRESSION,
+    FEATURE_SYNC_PAGES,
+    FEATURE_SYNC_FINGERPRINT,
+    BATCH_UNSUPPORTED_CODES,
+    HTTP_RETRY_STATUSES,
+    CONF_BATCH_SIZE,
+    CONF_BATCH_INTERVAL,
+    CONF_FULL_ATTRIBUTES,
+    CONF_SYNC_WORKERS,
+    CONF_TRANSPORT,
+    CONF_REPORT_QOS,
+    CONF_REPORT_SYNCENTITY,
+    CONF_MIN_INTERVAL,
+    CONF_DOMAIN_MIN_INTERVALS,
+    CONF_OPTIMISTIC,
+    CONF_OVERFLOW_POLICY,
+    CONF_QUEUE_MAX_ITEMS,
+    CONF_QUEUE_MAX_KB,
+    CONF_RECONNECT_MIN,
+    CONF_RECONNECT_MAX,
+    OVERFLOW_KEEP_LATEST,
+    TRANSPORT_MQTT,
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_BATCH_INTERVAL,
+    DEFAULT_SYNC_WORKERS,
+    DEFAULT_TRANSPORT,
+    DEFAULT_REPORT_QOS,
+    DEFAULT_MIN_INTERVAL,
+    DEFAULT_DOMAIN_MIN_INTERVALS,
+    DEFAULT_OVERFLOW_POLICY,
+    DEFAULT_QUEUE_MAX_ITEMS,
+    DEFAULT_QUEUE_MAX_KB,
+    DEFAULT_RECONNECT_MIN,
+    DEFAULT_RECONNECT_MAX,
+    QUEUE_OVERFLOW_WARN_INTERVAL,
+    COMPRESS_MIN_SIZE,
+    COMPRESS_EXECUTOR_SIZE,
+    SYNC_PAGE_SIZE,
+    SYNC_PAGE_RETRIES,
+    PLUGIN_STORAGE_VERSION,
+    CATALOG_STORAGE_VERSION,
+    VERSION_CHECK_TTL,
+    VERSION_CHECK_RETRY_MIN,
+    VERSION_CHECK_RETRY_MAX,
+    OUTBOX_RETRY_MIN,
+    OUTBOX_RETRY_MAX,
+    OUTBOX_FLUSH_TIMEOUT,
+    INTERACTIVE_WINDOW,
+    ACK_ACCEPTED,
+    ACK_DONE,
+    ACK_ERROR,
+    ERR_INVALID_COMMAND,
+    ERR_SERVICE_FAILED,
+)
 _LOGGER = logging.getLogger(__name__)
 TOPIC_COMMAND = 'ha2xiaodu/command/'
 TOPIC_REPORT = 'ha2xiaodu/report/'
 TOPIC_PING = 'topic_ping'
 
 
+def decode_token(token: str) -> dict:
+    """The mqtt and web connection settings of an account carried by its token."""
+    return json.loads(base64.b64decode(token).decode())
+
+
+def _retryable(res: dict | None) -> bool:
+    """Whether a failed upload may succeed later: no answer, a timeout or a server error.
+
+    An answer of the server refusing the data, e.g. an unknown entity, is not.
+    """
+    if res is None:
+        return True
+    status = res.get('http_status')
+    return status is not None and (status >= 500 or status in HTTP_RETRY_STATUSES)
+
+
+def _outbox_path(hass: HomeAssistant, storage_key: str) -> str:
+    return hass.config.path(STORAGE_DIR, f'{DOMAIN}.outbox.{storage_key}.jsonl')
+
+
+async def async_remove_storage(hass: HomeAssistant, storage_key: str) -> None:
+    """Remove the outbox, catalog and plugin config files kept for a config entry."""
+    path = _outbox_path(hass, storage_key)
+    try:
+        await hass.async_add_executor_job(os.remove, path)
+    except FileNotFoundError:
+        pass
+    except OSError as ex:
+        _LOGGER.error(f'remove outbox err:{ex}')
+    await Store(hass, CATALOG_STORAGE_VERSION, f'{DOMAIN}.catalog.{storage_key}').async_remove()
+    await Store(hass, PLUGIN_STORAGE_VERSION, f'{DOMAIN}.plugin.{storage_key}').async_remove()
+
+
 class DuerService:
     """Service handles mqtt topocs and connection."""
 
-    def __init__(self, hass: HomeAssistant, token: str) -> None:
+    def __init__(self, hass: HomeAssistant, token: str, config: dict | None = None,
+                 entry_id: str | None = None, connections: DuerConnections | None = None) -> None:
         """Initialize."""
         self.hass = hass
         self._token = token
+        self._entry_id = entry_id
+        config = config or {}
+        self._connections = connections if connections is not None else DuerConnections(hass)
         self._duer_mqtt_service = DuerMqttService(hass)
-        self.mqtt_online_cb: callable[None,
-                                      bool] = None
-        self.mqtt_online = False
-        self._start = False
         self._duer_mqtt_service.on_message_cb_list.append(
             self._on_mqtt_message)
         self._duer_mqtt_service.on_connect_cb_list.append(
             self._on_mqtt_connect)
+        self.mqtt_online_cb: callable[None,
+                                      bool] = None
+        self.mqtt_online = False
+        self._start = False
         self._mqtt_url: str = None
         self._web_url: str = None
         self._port: str = None
         self._user: str = None
         self._pwd: str = None
         self._version_check = False
+        self._version_checked_at: float = None
+        self._plugin_config: dict = {}
+        self._plugin_store: Store = None
+        self._batch_size: int = config.get(CONF_BATCH_SIZE, DEFAULT_BATCH_SIZE)
+        self._batch_interval: float = config.get(
+            CONF_BATCH_INTERVAL, DEFAULT_BATCH_INTERVAL) / 1000
+        self._batch_rejected = False
+        self._full_attributes: bool = config.get(CONF_FULL_ATTRIBUTES, False)
+        self._state_encoder = StateDeltaEncoder()
+        self._transport: str = config.get(CONF_TRANSPORT, DEFAULT_TRANSPORT)
+        self._report_qos: int = config.get(CONF_REPORT_QOS, DEFAULT_REPORT_QOS)
+        self._report_syncentity: bool = config.get(
+            CONF_REPORT_SYNCENTITY, False)
+        self._reconnect_min: float = config.get(
+            CONF_RECONNECT_MIN, DEFAULT_RECONNECT_MIN)
+        self._reconnect_max: float = config.get(
+            CONF_RECONNECT_MAX, DEFAULT_RECONNECT_MAX)
+        self._payload_prefixes: dict[tuple[str, bool], bytes] = {}
+        self._compression: str | None = None
         self._entity_list = []
-        self._session = async_create_clientsession(self.hass, False, True)
+        self._entity_ids: set[str] = set()
+        self._sync_workers: int = config.get(
+            CONF_SYNC_WORKERS, DEFAULT_SYNC_WORKERS)
+        self._session: ClientSession = None
         self._state_change_unsub = None
-        self._sync_state_queue: Queue = Queue(3000)
-        self._sync_state_task: Task = None
+        self.metrics = DuerMetrics()
+        self._overflow_policy: str = config.get(
+            CONF_OVERFLOW_POLICY, DEFAULT_OVERFLOW_POLICY)
+        self._overflow_warned_at: float = -math.inf
+        self._overflow_since_warn = 0
+        # the limits are split evenly over the worker shards
+        self._sync_state_queues = [PendingStateQueue(
+            self.metrics.queue_delay,
+            max_items=math.ceil(config.get(
+                CONF_QUEUE_MAX_ITEMS, DEFAULT_QUEUE_MAX_ITEMS) / self._sync_workers),
+            max_bytes=math.ceil(config.get(
+                CONF_QUEUE_MAX_KB, DEFAULT_QUEUE_MAX_KB) * 1024 / self._sync_workers),
+            policy=self._overflow_policy,
+            on_overflow=self._on_queue_overflow,
+        ) for _ in range(self._sync_workers)]
+        # entity id to the loop time until which its states use the interactive lane
+        self._interactive_until: dict[str, float] = {}
+        self._sync_state_tasks: list[Task] = []
         self._sync_state_lock = Lock()
+        try:
+            domain_intervals = parse_domain_intervals(config.get(
+                CONF_DOMAIN_MIN_INTERVALS, DEFAULT_DOMAIN_MIN_INTERVALS))
+        except ValueError as ex:
+            _LOGGER.error(f'domain min intervals config err:{ex}')
+            domain_intervals = {}
+        self._command_cache = CommandDedupeCache()
+        self._command_index = CommandIndex(hass)
+        self._optimistic: OptimisticStates | None = OptimisticStates(
+            hass, self._correct_state) if config.get(CONF_OPTIMISTIC, False) else None
+        # expected states queued for upload, sent with the provisional flag
+        self._provisional: dict[str, State] = {}
+        self._state_filter = SignificantStateFilter(hass, self._full_attributes)
+        self._rate_limiter = StateRateLimiter(
+            hass, self._enqueue_state,
+            config.get(CONF_MIN_INTERVAL, DEFAULT_MIN_INTERVAL), domain_intervals)
+        self._sync_entity_task: Task = None
+        self._catalog: EntityCatalog = None
+        # states taken from a queue and not yet uploaded, per worker
+        self._inflight_states: dict[int, list[State]] = {}
+        self._outbox: StateOutbox = None
+        self._outbox_task: Task = None
+        # upload backoff per worker shard, a failing shard does not hold back the others
+        self._retry_delays: list[float] = [0] * self._sync_workers
+        self._retry_at: list[float] = [0] * self._sync_workers
+        self._overflowed_at: float = -math.inf
+        self._stop_unsub = None
+        self._started_unsub = None
+        self._start_task: Task = None
+        self._stopped = False
 
     def _sub_state_change(self):
         @callback
@@ -56,23 +250,35 @@ class DuerService:
             new_state: State = event.data.get("new_state")
             if new_state is None:
                 return
-            try:
-                _LOGGER.debug(f"entity state change: {new_state}")
-                self._sync_state_queue.put_nowait(new_state)
-            except Exception as ex:
-                _LOGGER.error(f'sync state queue full: {ex}')
+            _LOGGER.debug(f"entity state change: {new_state}")
+            self._command_index.update_state(new_state)
+            if self._optimistic is not None and self._optimistic.reconcile(new_state) is False:
+                # the optimistic report was wrong, correct it without delay
+                self._rate_limiter.deliver_now(new_state)
+                return
+            if not self._state_filter.is_significant(new_state):
+                return
+            if self._is_interactive(new_state.entity_id):
+                # a user is waiting for the outcome of a command, skip the rate limit
+                self._rate_limiter.deliver_now(new_state)
+                return
+            self._rate_limiter.process(new_state)
         self._state_change_unsub = async_track_state_change_event(
             self.hass, self._entity_list, _entity_state_change_processor)
         _LOGGER.debug('state change sub success')
 
-    async def async_start(self, entity_list: list) -> None:
+    async def async_start(self, entity_list: list) -> bool:
+        """Start the service, the version check, mqtt connect and sync workers run in the background.
+
+        False when another entry already handles the commands of the account.
+        """
+        setup_start = time.monotonic()
         self._entity_list = entity_list
+        self._entity_ids = set(entity_list)
         _LOGGER.debug('duer mqtt service start')
         _LOGGER.debug(f'token:{self._token}')
-        self._duer_mqtt_service.entity_list = entity_list
         try:
-            conn_dic = json.loads(
-                base64.b64decode(self._token).decode())
+            conn_dic = decode_token(self._token)
             self._mqtt_url = conn_dic.get('mqtt_url')
             self._web_url = conn_dic.get('web_url')
             self._port = conn_dic.get('port')
@@ -80,30 +286,126 @@ class DuerService:
             self._pwd = conn_dic.get('password')
         except Exception as ex:
             _LOGGER.error(f'token decode error: {ex}')
-        self._version_check = await self._check_plugin_version()
+        if (owner := self._connections.claim_account(self._user, self._entry_id)) is not None:
+            _LOGGER.error(f'account {self._user} is already configured by entry {owner}, '
+                          f'remove one of the entries')
+            return False
+        self._command_index.async_setup(entity_list)
+        self._session = self._connections.acquire_session(self._web_url, self._sync_workers)
+        storage_key = self._entry_id or self._user
+        self._outbox = StateOutbox(self.hass, _outbox_path(self.hass, storage_key))
+        self._catalog = EntityCatalog(
+            self.hass, f'{DOMAIN}.catalog.{storage_key}')
+        self._plugin_store = Store(
+            self.hass, PLUGIN_STORAGE_VERSION, f'{DOMAIN}.plugin.{storage_key}')
+        self._stop_unsub = self.hass.bus.async_listen_once(
+            EVENT_HOMEASSISTANT_STOP, self._async_handle_hass_stop)
+        self._start_task = self.hass.async_create_background_task(
+            self._async_start_sync(), f'{self._user}_start')
+        _LOGGER.debug(
+            f'duer service setup in {time.monotonic() - setup_start:.3f}s')
+        return True
 
-        def _start(event: Event | None = None):
-            try:
-                if self._version_check:
-                    _LOGGER.debug('check version ok start post data')
-                    self.hass.create_task(self._duer_mqtt_service.connect(
-                        self._mqtt_url, self._port, self._user, self._pwd))
-                    self._sync_device_entities(self._entity_list)
-                    self._sub_state_change()
-                    self._start = True
-            except Exception as ex:
-                _LOGGER.error(f'start mqtt service err:{ex}')
+    async def _async_start_sync(self) -> None:
+        """Load local state and check the plugin version, then connect mqtt and start syncing."""
+        start = time.monotonic()
+        await asyncio.gather(self._outbox.async_load(), self._catalog.async_load())
+        cache = await self._plugin_store.async_load() or {}
+        delay = VERSION_CHECK_RETRY_MIN
+        while (version_check := await self._async_check_plugin_version(cache)) is None:
+            _LOGGER.warning(f'check plugin version err, retry in {delay}s')
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, VERSION_CHECK_RETRY_MAX)
+        self._version_check = version_check
+        _LOGGER.debug(
+            f'plugin version checked in {time.monotonic() - start:.3f}s: {version_check}')
+        if not self._version_check:
+            return
+        _LOGGER.debug('check version ok start post data')
+        # uploads wait for the plugin config, which decides batching, deltas and compression
+        self._sync_state_tasks = [
+            self.hass.async_create_background_task(
+                self._sync_entities_state_loop(index, queue), f'{self._user}_sync_state_entities_{index}')
+            for index, queue in enumerate(self._sync_state_queues)
+        ]
+        self._outbox_task = self.hass.async_create_background_task(
+            self._outbox_retry_loop(), f'{self._user}_sync_state_outbox')
+        self.hass.async_create_task(self._duer_mqtt_service.connect(
+            self._mqtt_url, self._port, self._user, self._pwd,
+            reconnect_min=self._reconnect_min, reconnect_max=self._reconnect_max))
+        try:
+            await self._state_filter.async_setup()
+        except Exception as ex:
+            _LOGGER.error(f'significant change setup err:{ex}')
         if self.hass.state == CoreState.running:
-            _start()
+            self._start_sync()
         else:
-            self.hass.bus.async_listen_once(
-                EVENT_HOMEASSISTANT_STARTED, _start)
-        await asyncio.sleep(3)
-        self._sync_state_task = self.hass.async_create_background_task(
-            self._sync_entities_state_loop(), f'{self._user}_sync_state_entities')
+            self._started_unsub = self.hass.bus.async_listen_once(
+                EVENT_HOMEASSISTANT_STARTED, self._start_sync)
+
+    @callback
+    def _start_sync(self, event: Event | None = None) -> None:
+        self._started_unsub = None
+        try:
+            self._command_index.async_refresh()
+            self._sync_device_entities(self._entity_list)
+            self._sub_state_change()
+            self._start = True
+        except Exception as ex:
+            _LOGGER.error(f'start mqtt service err:{ex}')
 
-    def stop(self) -> None:
+    async def _async_handle_hass_stop(self, event: Event) -> None:
+        self._stop_unsub = None
+        await self.async_stop()
+
+    async def async_stop(self) -> None:
+        """Stop the service, flush pending states within a deadline and keep the rest in the outbox."""
+        if self._stopped:
+            return
+        self._stopped = True
+        if self._stop_unsub:
+            self._stop_unsub()
+            self._stop_unsub = None
+        if self._started_unsub:
+            self._started_unsub()
+            self._started_unsub = None
+        if self._state_change_unsub:
+            self._state_change_unsub()
+            self._state_change_unsub = None
+        self._command_index.async_stop()
+        if self._optimistic is not None:
+            self._optimistic.clear()
+        self._provisional.clear()
+        # deliver held back states so the final state of every entity is flushed
+        self._rate_limiter.flush()
+        for task in [*self._sync_state_tasks, self._outbox_task, self._sync_entity_task, self._start_task]:
+            if isinstance(task, Task) and not task.done():
+                task.cancel()
+        self._sync_state_tasks = []
+        states: list[State] = []
+        for inflight in self._inflight_states.values():
+            states.extend(inflight)
+        self._inflight_states.clear()
+        for queue in self._sync_state_queues:
+            states.extend(queue.drain())
+        if states and self._outbox is not None:
+            now = self.hass.loop.time()
+            ready = [state for state in states if now >= self._retry_at[self._shard(state.entity_id)]]
+            failed = [state for state in states if now < self._retry_at[self._shard(state.entity_id)]]
+            if ready:
+                try:
+                    async with asyncio.timeout(OUTBOX_FLUSH_TIMEOUT):
+                        failed += (await self._post_states(ready))[0]
+                except TimeoutError:
+                    _LOGGER.warning('flush pending states timeout')
+                    failed += ready
+            await self._outbox.async_add(failed)
+            _LOGGER.debug(
+                f'flushed {len(states) - len(failed)} states, {len(failed)} kept in outbox')
         self._duer_mqtt_service.stop()
+        if self._session is not None:
+            await self._connections.async_release_session(self._web_url, self._sync_workers)
+        self._connections.release_account(self._user, self._entry_id)
 
     async def _get_data(self, session: ClientSession, url: str):
         try:
@@ -116,101 +418,466 @@ class DuerService:
         except Exception as ex:
             _LOGGER.error(f'get data err:{ex}')
 
-    async def _post_data(self, url: str, data: dict):
+    async def _post_data(self, url: str, data: dict | bytes) -> dict | None:
+        """Post data to web_url, return the server response or None if the request failed."""
         try:
             if isinstance(self._session, ClientSession):
-                if self._session.closed:
-                    self._session = async_create_clientsession(
-                        self.hass, False, True)
+                # replaced when closed or when entries sharing it come and go
+                self._session = self._connections.session(self._web_url)
             post_headers = {'Content-Type': 'application/json'}
-            j_data = json.dumps(data)
-            _LOGGER.debug(f"post json:{j_data}")
+            j_data = data if isinstance(data, bytes) else json_bytes(data)
+            _LOGGER.debug("post json:%s", j_data)
+            body = j_data
+            if (encoding := self._compression) and len(j_data) >= COMPRESS_MIN_SIZE:
+                if len(j_data) >= COMPRESS_EXECUTOR_SIZE:
+                    body = await self.hass.async_add_executor_job(compress, j_data, encoding)
+                else:
+                    body = compress(j_data, encoding)
+                post_headers['Content-Encoding'] = encoding
+            post_start = time.monotonic()
             res: ClientResponse = await self._session.post(
-                url, data=j_data, headers=post_headers)
+                url, data=body, headers=post_headers)
             res.raise_for_status()
-            dic_res: dict = await res.json()
+            dic_res: dict = await res.json(loads=json_loads)
+            self.metrics.post_latency.add(
+                (time.monotonic() - post_start) * 1000)
             if 'code' in dic_res and dic_res['code'] == 0:
-                _LOGGER.debug(f"res raw_data:{dic_res}")
+                _LOGGER.debug("res raw_data:%s", dic_res)
             else:
-                _LOGGER.error(f"post data:{data}, res raw_data:{dic_res}")
+                _LOGGER.error(f"post data:{j_data}, res raw_data:{dic_res}")
+            return dic_res
+        except ClientResponseError as ex:
+            # the server answered but refused the request, e.g. unknown api on an old server
+            _LOGGER.error(f'post data err:{ex}')
+            if ex.status == 415 and self._compression:
+                _LOGGER.warning(f'server refused {self._compression} body, disable compression')
+                self._compression = None
+            return {'code': ex.status, 'msg': ex.message, 'http_status': ex.status}
         except Exception as ex:
             _LOGGER.error(f'post data err:{ex}')
 
-    async def _check_plugin_version(self):
+    def _report_payload(self, report_type: str, data: bytes, credentials: bool) -> bytes:
+        """Splice encoded data into a cached json template of the report envelope."""
+        key = (report_type, credentials)
+        if (prefix := self._payload_prefixes.get(key)) is None:
+            envelope = {'type': report_type}
+            if credentials:
+                envelope['openid'] = self._user
+                envelope['secret'] = self._pwd
+            prefix = self._payload_prefixes[key] = json_bytes(envelope)[:-1] + b',"data":'
+        return prefix + data + b'}'
+
+    async def _send_report(self, url: str, report_type: str, data: bytes, mqtt_allowed: bool = True) -> dict | None:
+        """Publish a report on the report topic with mqtt transport, post it to web_url otherwise or when mqtt is down."""
+        if mqtt_allowed and self._transport == TRANSPORT_MQTT and self._duer_mqtt_service.connected:
+            payload = self._report_payload(report_type, data, False)
+            if self._duer_mqtt_service.publish(f'{TOPIC_REPORT}{self._user}', payload, qos=self._report_qos):
+                return {'code': 0}
+            _LOGGER.warning(f'publish {report_type} failed, fall back to http')
+        return await self._post_data(url, self._report_payload(report_type, data, True))
+
+    async def _async_check_plugin_version(self, cache: dict) -> bool | None:
+        """Check the plugin version, None when it could not be checked.
+
+        A cached plugin config younger than VERSION_CHECK_TTL is used without
+        asking the server, an older one only when the server is unreachable.
+        """
+        cached = cache.get('web_url') == self._web_url and isinstance(
+            cache.get('plugin_config'), dict)
+        if cached and time.time() - cache.get('checked_at', 0) < VERSION_CHECK_TTL:
+            self._apply_plugin_config(cache['plugin_config'], cache['checked_at'])
+            return self._check_plugin_version()
+        res_dic = await self._get_data(
+            self._connections.session(self._web_url), f'{self._web_url}{CONST_GET_VERSION_CHECK_URL}')
+        if res_dic is None or not isinstance(res_dic.get('data'), dict):
+            if not cached:
+                return None
+            _LOGGER.warning('plugin config unreachable, use the cached one')
+            self._apply_plugin_config(cache['plugin_config'], cache['checked_at'])
+            return self._check_plugin_version()
+        checked_at = time.time()
+        self._apply_plugin_config(res_dic['data'], checked_at)
+        cache.update(web_url=self._web_url, checked_at=checked_at,
+                     plugin_config=res_dic['data'])
+        await self._plugin_store.async_save(cache)
+        return self._check_plugin_version()
+
+    def _apply_plugin_config(self, plugin_config: dict, checked_at: float) -> None:
+        self._plugin_config = plugin_config
+        self._version_checked_at = checked_at
+        self._compression = select_encoding(
+            self._plugin_config.get(FEATURE_COMPRESSION))
+
+    def _check_plugin_version(self) -> bool:
         check_state = False
-        res_dic = await self._get_data(self._session, f'{self._web_url}{CONST_GET_VERSION_CHECK_URL}')
-        if res_dic is None:
-            _LOGGER.error('check plugin version err')
-            return
-        if 'data' in res_dic.keys():
-            if 'plugin_version' in res_dic['data'].keys():
-                str_version = res_dic['data']['plugin_version']
-                current_version = datetime.strptime(CONST_VERSION, "%Y.%m.%d")
-                get_version = datetime.strptime(str_version, "%Y.%m.%d")
-                if current_version >= get_version:
-                    check_state = True
-                else:
-                    _LOGGER.error(
-                        'duermqtt plugin version is too old,please update plugin')
+        if 'plugin_version' in self._plugin_config.keys():
+            str_version = self._plugin_config['plugin_version']
+            current_version = datetime.strptime(CONST_VERSION, "%Y.%m.%d")
+            get_version = datetime.strptime(str_version, "%Y.%m.%d")
+            if current_version >= get_version:
+                check_state = True
+            else:
+                _LOGGER.error(
+                    'duermqtt plugin version is too old,please update plugin')
         return check_state
 
-    def _sync_device_entities(self, entities: list[str]):
+    def _sync_device_entities(self, entities: list[str], fingerprint: str | None = None):
         if isinstance(entities, list):
-            _LOGGER.debug('start sync entities')
-            entity_list = []
-            for entity in entities:
-                state: State = self.hass.states.get(entity)
-                if isinstance(state, State):
-                    entity_list.append(state.as_dict())
-            post_device_data = {
-                'type': 'syncentity',
-                'data': entity_list,
-                'openid': self._user,
-                'secret': self._pwd
-            }
-            self.hass.add_job(
-                self._post_data(f'{self._web_url}{CONST_POST_SYNC_DEVICE_URL}', post_device_data))
+            if isinstance(self._sync_entity_task, Task) and not self._sync_entity_task.done():
+                # a newer catalog replaces the one still uploading
+                self._sync_entity_task.cancel()
+            self._sync_entity_task = self.hass.async_create_background_task(
+                self._async_sync_device_entities(entities, fingerprint), f'{self._user}_sync_entities')
+
+    def _iter_entity_pages(self, entities: list[str], page_size: int) -> Iterator[list[bytes]]:
+        """Encode the entity catalog lazily, page by page."""
+        page = []
+        for entity in entities:
+            state: State = self.hass.states.get(entity)
+            if isinstance(state, State):
+                page.append(encode_entity_json(state, self._full_attributes))
+                if len(page) >= page_size:
+                    yield page
+                    page = []
+        if page:
+            yield page
+
+    async def _async_sync_device_entities(self, entities: list[str], fingerprint: str | None = None) -> None:
+        """Sync the entity catalog, only the changes when the server holds our last catalog."""
+        _LOGGER.debug('start sync entities')
+        if not self._plugin_config.get(FEATURE_SYNC_FINGERPRINT):
+            await self._async_upload_entities(entities)
+            return
+        salt = f'full_attributes={self._full_attributes}'
+        hashes = {}
+        for entity in entities:
+            state: State = self.hass.states.get(entity)
+            if isinstance(state, State):
+                hashes[entity] = entity_hash(state, salt)
+        root = catalog_fingerprint(hashes)
+        base = self._catalog.fingerprint
+        url = f'{self._web_url}{CONST_POST_SYNC_DEVICE_URL}'
+        # without a fingerprint from the server assume it still holds the last acknowledged catalog,
+        # the server rejects the diff if it does not
+        if base is not None and fingerprint in (None, base):
+            if root == base:
+                res = await self._send_report(
+                    url, 'syncentity_unchanged', json_bytes({'fingerprint': root}), self._report_syncentity)
+            else:
+                changed, removed = self._catalog.diff(hashes)
+                header = json_bytes({'fingerprint': root, 'base': base, 'removed': removed})
+                fragments = [fragment for page in self._iter_entity_pages(changed, SYNC_PAGE_SIZE)
+                             for fragment in page]
+                data = header[:-1] + b',"entities":' + json_array(fragments) + b'}'
+                res = await self._send_report(url, 'syncentity_diff', data, self._report_syncentity)
+            if res is not None and res.get('code') == 0:
+                self._catalog.update(hashes, root)
+                _LOGGER.debug(f'sync entities by fingerprint finish {root}')
+                return
+            _LOGGER.debug(f'server catalog does not match {base}, upload all entities')
+        if await self._async_upload_entities(entities, root):
+            self._catalog.update(hashes, root)
+
+    async def _async_upload_entities(self, entities: list[str], fingerprint: str | None = None) -> bool:
+        url = f'{self._web_url}{CONST_POST_SYNC_DEVICE_URL}'
+        if not self._plugin_config.get(FEATURE_SYNC_PAGES) and fingerprint is None:
+            entity_list = [
+                fragment for page in self._iter_entity_pages(entities, SYNC_PAGE_SIZE) for fragment in page]
+            res = await self._send_report(url, 'syncentity', json_array(entity_list), self._report_syncentity)
             _LOGGER.debug('sync entities finish')
+            return res is not None and res.get('code') == 0
+        session_id = uuid.uuid4().hex
+        pages = self._iter_entity_pages(entities, SYNC_PAGE_SIZE)
+        page = next(pages, [])
+        page_no = 0
+        while True:
+            next_page = next(pages, None)
+            page_no += 1
+            header = {
+                'session': session_id,
+                'page': page_no,
+                'last': next_page is None,
+            }
+            if fingerprint is not None:
+                header['fingerprint'] = fingerprint
+            data = json_bytes(header)[:-1] + b',"entities":' + json_array(page) + b'}'
+            for retry in range(SYNC_PAGE_RETRIES + 1):
+                res = await self._send_report(url, 'syncentity_page', data, self._report_syncentity)
+                if res is not None and res.get('code') == 0:
+                    break
+                if retry < SYNC_PAGE_RETRIES:
+                    await asyncio.sleep(2 ** retry)
+            else:
+                _LOGGER.error(
+                    f'sync entities session {session_id} failed at page {page_no}')
+                return False
+            if next_page is None:
+                break
+            page = next_page
+        _LOGGER.debug(f'sync entities finish, {page_no} pages')
+        return True
+
+    @property
+    def batch_enabled(self) -> bool:
+        """Batch upload is used when configured and supported by the server."""
+        return (self._batch_size > 1
+                and bool(self._plugin_config.get(FEATURE_BATCH_STATE))
+                and not self._batch_rejected)
+
+    def _shard(self, entity_id: str) -> int:
+        return zlib.crc32(entity_id.encode()) % len(self._sync_state_queues)
+
+    def _enqueue_state(self, state: State) -> None:
+        """Queue a state on the worker shard of its entity, which keeps per entity order."""
+        index = self._shard(state.entity_id)
+        lane = LANE_INTERACTIVE if self._is_interactive(state.entity_id) else LANE_BACKGROUND
+        self._sync_state_queues[index].put(state, lane)
+        self.metrics.record_queue_depth(self.queue_depth)
 
     @callback
-    async def _sync_entities_state_loop(self):
-        # await asyncio.sleep(10)
-        # _LOGGER.debug('start sync entities')
-        # for entity in self._entity_list:
-        #     e_state: State = self.hass.states.get(entity)
-        #     if isinstance(e_state, State):
-        #         post_device_data = {
-        #             'type': 'state_changed',
-        #             'data': e_state.as_dict(),
-        #             'openid': self._user,
-        #             'secret': self._pwd
-        #         }
-        #         await self._post_data(self._session, f'{self._web_url}{CONST_POST_SYNC_STATE_URL}', post_device_data)
-        #         await asyncio.sleep(0.01)
+    def _on_queue_overflow(self, states: list[State]) -> None:
+        """Handle states pushed out of a full queue, warn at most every QUEUE_OVERFLOW_WARN_INTERVAL."""
+        now = self.hass.loop.time()
+        self._overflowed_at = now
+        keep = self._overflow_policy == OVERFLOW_KEEP_LATEST and self._outbox is not None
+        if keep:
+            self.hass.async_create_task(self._outbox.async_add(states))
+        self._overflow_since_warn += len(states)
+        if now - self._overflow_warned_at < QUEUE_OVERFLOW_WARN_INTERVAL:
+            return
+        _LOGGER.warning(
+            f'sync queue full ({self._overflow_policy}), {self._overflow_since_warn} states '
+            f'{"moved to outbox" if keep else "dropped"} since last warning, '
+            f'{self.overflowed_updates} in total')
+        self._overflow_warned_at = now
+        self._overflow_since_warn = 0
+
+    @property
+    def overflowed_updates(self) -> int:
+        """States dropped or moved to the outbox because a queue was full."""
+        return sum(queue.overflowed for queue in self._sync_state_queues)
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(queue) for queue in self._sync_state_queues)
+
+    @property
+    def dropped_updates(self) -> int:
+        """States replaced by a newer one of the same entity before upload."""
+        return sum(queue.coalesced for queue in self._sync_state_queues) + self._rate_limiter.suppressed
+
+    @property
+    def filtered_updates(self) -> int:
+        return self._state_filter.filtered
+
+    @property
+    def duplicate_commands(self) -> int:
+        return self._command_cache.suppressed
+
+    @property
+    def mqtt_metrics(self) -> MqttMetrics:
+        return self._duer_mqtt_service.metrics
+
+    def diagnostics(self) -> dict:
+        """Snapshot of connection, queues and metrics for the diagnostics download."""
+        mqtt_metrics = self.mqtt_metrics
+        domains = Counter(split_entity_id(entity_id)[0] for entity_id in self._entity_list)
+        return {
+            'connection': {
+                'mqtt_url': self._mqtt_url,
+                'port': self._port,
+                'web_url': self._web_url,
+                'username': self._user,
+                'password': self._pwd,
+            },
+            'shared_connections': self._connections.diagnostics(),
+            'mqtt': {
+                'connected': self._duer_mqtt_service.connected,
+                'messages_in': mqtt_metrics.messages_in,
+                'messages_out': mqtt_metrics.messages_out,
+                'reconnects': mqtt_metrics.reconnects,
+                'last_connected': mqtt_metrics.last_connected,
+                'last_outage': mqtt_metrics.last_outage,
+                'reconnect_duration': mqtt_metrics.reconnect_duration.histogram(),
+            },
+            'plugin': {
+                'version_check': self._version_check,
+                'checked_at': (dt_util.utc_from_timestamp(self._version_checked_at)
+                               if self._version_checked_at else None),
+                'config': self._plugin_config,
+                'compression': self._compression,
+                'batch_enabled': self.batch_enabled,
+            },
+            'sync': {
+                'started': self._start,
+                'workers': len(self._sync_state_queues),
+                'queue_depth': [len(queue) for queue in self._sync_state_queues],
+                'interactive_depth': sum(queue.lane_size(LANE_INTERACTIVE) for queue in self._sync_state_queues),
+                'queue_bytes': sum(queue.size_bytes for queue in self._sync_state_queues),
+                'blocked': sum(queue.blocked for queue in self._sync_state_queues),
+                'overflow_policy': self._overflow_policy,
+                'overflowed': self.overflowed_updates,
+                'queue_depth_peak': self.metrics.queue_depth_peak,
+                'outbox_size': len(self._outbox) if self._outbox is not None else 0,
+                'retry_delay': self._retry_delays,
+                'uploaded': self.metrics.uploaded,
+                'failed': self.metrics.failed,
+                'rejected': self.metrics.rejected,
+                'dropped': self.dropped_updates,
+                'filtered': self.filtered_updates,
+            },
+            'commands': {
+                'targets': len(self._command_index),
+                'optimistic_pending': len(self._optimistic) if self._optimistic is not None else 0,
+                'optimistic_corrections': self._optimistic.corrections if self._optimistic is not None else 0,
+                'dedupe_cache': len(self._command_cache),
+                'duplicates': self._command_cache.suppressed,
+            },
+            'latency': {
+                'upload': self.metrics.post_latency.histogram(),
+                'command': self.metrics.command_latency.histogram(),
+                'queue_interactive': self.metrics.queue_delay[LANE_INTERACTIVE].histogram(),
+                'queue_background': self.metrics.queue_delay[LANE_BACKGROUND].histogram(),
+            },
+            'entities': {
+                'total': len(self._entity_list),
+                'per_domain': dict(domains),
+            },
+        }
+
+    async def _get_state_batch(self, queue: PendingStateQueue) -> list[State]:
+        """Wait for pending states, coalesced per entity, up to batch size or batch interval."""
+        if not self.batch_enabled:
+            return await queue.get_batch()
+        return await queue.get_batch(self._batch_size, self._batch_interval)
+
+    def _encode_state(self, state: State) -> bytes:
+        """Encode a state to json, as delta against the last sent one if the server supports it."""
+        if self._provisional.get(state.entity_id) is state:
+            # the server takes the provisional state as base, the next real state must be a full one
+            self._state_encoder.reset([state.entity_id])
+            return encode_state_json(state, self._full_attributes)[:-1] + b',"provisional":true}'
+        if not self._plugin_config.get(FEATURE_STATE_DELTA):
+            return encode_state_json(state, self._full_attributes)
+        seq, delta = self._state_encoder.encode(
+            encode_state(state, self._full_attributes))
+        if delta is not None:
+            return json_bytes(delta)
+        return b'{"seq":%d,"full":true,' % seq + encode_state_json(state, self._full_attributes)[1:]
+
+    async def _post_states(self, states: list[State]) -> tuple[list[State], list[State]]:
+        """Upload states, return the ones that failed and may be retried and the ones the server refused."""
+        states = [state for state in states if isinstance(state, State)]
+        if len(states) > 1 and self.batch_enabled:
+            _LOGGER.debug(f'post_change batch data: {len(states)}')
+            res = await self._send_report(
+                f'{self._web_url}{CONST_POST_SYNC_STATE_BATCH_URL}', 'state_changed_batch',
+                json_array([self._encode_state(state) for state in states]))
+            if res is not None and res.get('code') == 0:
+                return [], []
+            # the server did not apply these deltas, send full snapshots next time
+            self._state_encoder.reset(state.entity_id for state in states)
+            if res is not None and res.get('code') in BATCH_UNSUPPORTED_CODES:
+                _LOGGER.warning(
+                    f'state batch upload not supported by server: {res}, fall back to single post')
+                self._batch_rejected = True
+            elif _retryable(res):
+                return states, []
+            else:
+                # find the refused states by posting them one by one
+                _LOGGER.debug(f'state batch refused: {res}, post states one by one')
+        failed = []
+        rejected = []
+        for state in states:
+            _LOGGER.debug('post_change data')
+            res = await self._send_report(
+                f'{self._web_url}{CONST_POST_SYNC_STATE_URL}', 'state_changed', self._encode_state(state))
+            if res is not None and res.get('code') == 0:
+                continue
+            self._state_encoder.reset([state.entity_id])
+            (failed if _retryable(res) else rejected).append(state)
+        return failed, rejected
+
+    def _sync_full_states(self, entity_ids: list[str] | None = None) -> None:
+        """Queue full snapshots of the given entities, all included entities by default."""
+        entity_ids = [entity_id for entity_id in entity_ids or self._entity_list
+                      if entity_id in self._entity_ids]
+        self._state_encoder.reset(entity_ids)
+        for entity_id in entity_ids:
+            state = self.hass.states.get(entity_id)
+            if isinstance(state, State):
+                self._enqueue_state(state)
+
+    async def _upload_states(self, index: int, states: list[State]) -> None:
+        """Upload states of a shard, states that fail or arrive while it backs off go to the outbox.
+
+        States the server refused are dropped, retrying them would only fail again.
+        """
+        if self.hass.loop.time() < self._retry_at[index]:
+            self._drop_provisional(states)
+            await self._outbox.async_add(states)
+            return
+        failed, rejected = await self._post_states(states)
+        self._drop_provisional(states)
+        self.metrics.record_upload(len(states) - len(failed) - len(rejected), True)
+        if rejected:
+            self.metrics.rejected += len(rejected)
+            _LOGGER.debug(f'server refused {len(rejected)} states, dropped')
+        if failed:
+            self.metrics.record_upload(len(failed), False)
+            delay = self._retry_delays[index] = min(
+                max(self._retry_delays[index] * 2, OUTBOX_RETRY_MIN), OUTBOX_RETRY_MAX)
+            self._retry_at[index] = self.hass.loop.time() + delay
+            _LOGGER.warning(
+                f'upload {len(failed)} states failed, retry shard {index} in {delay}s')
+            await self._outbox.async_add(failed)
+        else:
+            self._retry_delays[index] = 0
+        if len(self._outbox):
+            failed_ids = {state.entity_id for state in failed}
+            await self._outbox.async_remove(
+                state.entity_id for state in states if state.entity_id not in failed_ids)
+
+    def _drop_provisional(self, states: list[State]) -> None:
+        """Forget handled provisional states, one moved to the outbox is retried as the real state."""
+        for state in states:
+            if self._provisional.get(state.entity_id) is state:
+                del self._provisional[state.entity_id]
+
+    async def _outbox_retry_loop(self):
+        """Re-queue outbox states of the shards whose backoff delay has passed."""
+        while True:
+            await asyncio.sleep(max(min(self._retry_at) - self.hass.loop.time(), OUTBOX_RETRY_MIN))
+            now = self.hass.loop.time()
+            # states moved out of a full queue would only overflow it again
+            if len(self._outbox) and now - self._overflowed_at >= OUTBOX_RETRY_MIN:
+                _LOGGER.debug(f'retry {len(self._outbox)} outbox states')
+                for state in self._outbox.states():
+                    if now >= self._retry_at[self._shard(state.entity_id)]:
+                        self._enqueue_state(state)
+
+    @callback
+    async def _sync_entities_state_loop(self, index: int, queue: PendingStateQueue):
         _LOGGER.debug('start sync state queue loop')
-        # self._sync_state_queue = asyncio.Queue(3000)
         while True:
             try:
-                if isinstance(self._sync_state_queue, asyncio.Queue):
-                    state: State = await self._sync_state_queue.get()
-                    self._sync_state_queue.task_done()
-                    _LOGGER.debug('post_change data')
-                    if isinstance(state, State):
-                        post_device_data = {
-                            'type': 'state_changed',
-                            'data': state.as_dict(),
-                            'openid': self._user,
-                            'secret': self._pwd
-                        }
-                        await self._post_data(f'{self._web_url}{CONST_POST_SYNC_STATE_URL}', post_device_data)
+                if isinstance(queue, PendingStateQueue):
+                    states = await self._get_state_batch(queue)
+                    self._inflight_states[index] = states
+                    await self._upload_states(index, states)
+                    self._inflight_states.pop(index, None)
+            except asyncio.CancelledError:
+                raise
             except Exception as ex:
+                self._inflight_states.pop(index, None)
                 _LOGGER.error(f'get queue error {ex}')
-            await asyncio.sleep(0.01)
+                await asyncio.sleep(0.01)
 
     def _on_mqtt_connect(self, state):
         self.mqtt_online = state
-        self._duer_mqtt_service.subscribe(
-            f'{TOPIC_COMMAND}{self._user}', 0)
+        if state:
+            # the server may have missed deltas while we were offline
+            self._state_encoder.reset()
         if callable(self.mqtt_online_cb):
             self.mqtt_online_cb(state)
 
@@ -221,24 +888,185 @@ class DuerService:
             match cmd_type:
                 case 'syncentity':
                     _LOGGER.debug(f'sync device entitys:{self._entity_list}')
-                    self._sync_device_entities(self._entity_list)
-                case 'callservice':
-                    self._call_service(data)
+                    self._sync_device_entities(
+                        self._entity_list, data.get('fingerprint'))
+                case 'fullstate':
+                    entity_ids = data.get('entity_id')
+                    if isinstance(entity_ids, str):
+                        entity_ids = [entity_ids]
+                    self._sync_full_states(entity_ids)
+                case 'callservice' | 'callservice_batch':
+                    if self._is_duplicate_command(data):
+                        return
+                    if cmd_type == 'callservice':
+                        self._call_service(data, time.monotonic())
+                    else:
+                        self._call_service_batch(data, time.monotonic())
 
-    def _call_service(self, data: dict) -> None:
+    def _is_duplicate_command(self, data: dict) -> bool:
+        """Answer a redelivered command from its cached outcome instead of running it again."""
+        request_id = data.get('request_id')
+        if not request_id:
+            return False
+        duplicate, outcome = self._command_cache.check(request_id)
+        if not duplicate:
+            return False
+        _LOGGER.debug(f'drop duplicate command {request_id}')
+        if outcome is not None:
+            self._publish_ack(request_id, outcome['status'], duplicate=True,
+                              **{key: value for key, value in outcome.items()
+                                 if key not in ('request_id', 'status')})
+        return True
+
+    def _publish_ack(self, request_id: str, status: str, **fields) -> None:
+        """Publish a callservice acknowledgement on the report topic."""
+        ack = {'request_id': request_id, 'status': status, **fields}
+        _LOGGER.debug(f'callservice ack: {ack}')
+        if not fields.get('duplicate'):
+            self._command_cache.set_outcome(request_id, ack)
+        self._duer_mqtt_service.publish(
+            f'{TOPIC_REPORT}{self._user}',
+            self._report_payload('callservice_ack', json_bytes(ack), False),
+            qos=self._report_qos)
+
+    def _call_service(self, data: dict, received_at: float) -> None:
+        """Validate a command and run it, acking it when it carries a request_id."""
         _LOGGER.debug(f'call hass service: {data}')
-        service = data.get('service')
+        request_id = data.get('request_id')
+        target, error = self._command_index.validate(data.get('entity_id'), data.get('service'))
+        if error:
+            _LOGGER.warning(f'reject command {data}: {error}')
+            if request_id:
+                self._publish_ack(request_id, ACK_ERROR, error=error)
+            return
         s_data = data.get('service_data')
-        entity_id = data.get('entity_id')
-        domain = entity_id.split('.')[0]
-        if not s_data:
-            s_data = {
-                'entity_id': entity_id
-            }
-        if isinstance(s_data, dict):
-            s_data['entity_id'] = entity_id
+        if not isinstance(s_data, dict):
+            s_data = {}
+        s_data['entity_id'] = target.entity_id
+        if request_id:
+            self._publish_ack(request_id, ACK_ACCEPTED)
+        self._mark_interactive(target.entity_id)
+        self._report_optimistic(target, data['service'], s_data)
+        self.hass.async_create_task(self._async_call_service(
+            target.domain, data['service'], s_data, request_id, received_at), eager_start=True)
+
+    async def _async_call_service(self, domain: str, service: str, service_data: dict,
+                                  request_id: str | None, received_at: float) -> None:
+        start = time.monotonic()
+        try:
+            await self.hass.services.async_call(
+                domain=domain, service=service, service_data=service_data, blocking=True)
+        except Exception as ex:
+            _LOGGER.error(f'call service {domain}.{service} err:{ex}')
+            self._correct_optimistic([service_data['entity_id']])
+            if request_id:
+                self._publish_ack(request_id, ACK_ERROR,
+                                  error=ERR_SERVICE_FAILED, msg=str(ex))
+            return
+        end = time.monotonic()
+        self.metrics.command_latency.add((end - received_at) * 1000)
+        if request_id:
+            self._publish_ack(request_id, ACK_DONE,
+                              latency_ms=round((end - start) * 1000, 1))
 
-        _LOGGER.debug(f'call data:{s_data}')
-        self.hass.add_job(self.hass.services.async_call(
-            domain=domain, service=service, service_data=s_data, blocking=False
-        ))
+    def _call_service_batch(self, data: dict, received_at: float) -> None:
+        """Run a list of commands, calls with the same service and data share one service call."""
+        request_id = data.get('request_id')
+        calls = data.get('calls')
+        if not isinstance(calls, list) or not calls:
+            _LOGGER.warning(f'reject command batch {data}: {ERR_INVALID_COMMAND}')
+            if request_id:
+                self._publish_ack(request_id, ACK_ERROR, error=ERR_INVALID_COMMAND)
+            return
+        groups: dict[tuple[str, str, str], tuple[dict, list[str]]] = {}
+        failed: list[dict] = []
+        for call in calls:
+            if not isinstance(call, dict):
+                failed.append({'entity_id': None, 'error': ERR_INVALID_COMMAND})
+                continue
+            target, error = self._command_index.validate(call.get('entity_id'), call.get('service'))
+            if error:
+                failed.append({'entity_id': call.get('entity_id'), 'error': error})
+                continue
+            s_data = call.get('service_data')
+            s_data = {key: value for key, value in s_data.items() if key != 'entity_id'} \
+                if isinstance(s_data, dict) else {}
+            self._mark_interactive(target.entity_id)
+            self._report_optimistic(target, call['service'], s_data)
+            key = (target.domain, call['service'], json_dumps_sorted(s_data))
+            groups.setdefault(key, (s_data, []))[1].append(target.entity_id)
+        _LOGGER.debug(f'call service batch: {len(calls)} calls in {len(groups)} groups')
+        if not groups:
+            if request_id:
+                self._publish_ack(request_id, ACK_ERROR, failed=failed)
+            return
+        if request_id:
+            self._publish_ack(request_id, ACK_ACCEPTED, failed=failed)
+        self.hass.async_create_task(self._async_call_service_batch(
+            groups, failed, request_id, received_at), eager_start=True)
+
+    async def _async_call_service_batch(self, groups: dict[tuple[str, str, str], tuple[dict, list[str]]],
+                                        failed: list[dict], request_id: str | None, received_at: float) -> None:
+        start = time.monotonic()
+        results = await asyncio.gather(*(
+            self.hass.services.async_call(
+                domain=domain, service=service,
+                service_data={**s_data, 'entity_id': entity_ids}, blocking=True)
+            for (domain, service, _), (s_data, entity_ids) in groups.items()
+        ), return_exceptions=True)
+        succeeded = 0
+        for ((domain, service, _), (_, entity_ids)), result in zip(groups.items(), results):
+            if isinstance(result, Exception):
+                _LOGGER.error(f'call service {domain}.{service} err:{result}')
+                self._correct_optimistic(entity_ids)
+                failed.extend({'entity_id': entity_id, 'error': ERR_SERVICE_FAILED, 'msg': str(result)}
+                              for entity_id in entity_ids)
+            else:
+                succeeded += len(entity_ids)
+        end = time.monotonic()
+        if succeeded:
+            self.metrics.command_latency.add((end - received_at) * 1000)
+        if request_id:
+            self._publish_ack(request_id, ACK_DONE if succeeded else ACK_ERROR,
+                              latency_ms=round((end - start) * 1000, 1), failed=failed)
+
+    def _mark_interactive(self, entity_id: str) -> None:
+        """States of an entity a user just commanded skip ahead of background updates."""
+        self._interactive_until[entity_id] = self.hass.loop.time() + INTERACTIVE_WINDOW
+
+    def _is_interactive(self, entity_id: str) -> bool:
+        if (until := self._interactive_until.get(entity_id)) is None:
+            return False
+        if self.hass.loop.time() < until:
+            return True
+        del self._interactive_until[entity_id]
+        return False
+
+    def _report_optimistic(self, target: CommandTarget, service: str, service_data: dict) -> None:
+        """Report the state a command is expected to lead to before HA reports the real one."""
+        if self._optimistic is None:
+            return
+        state = expected_state(target.domain, service, service_data,
+                               self.hass.states.get(target.entity_id))
+        if state is None:
+            return
+        self._optimistic.expect(state)
+        # queued on the shard of the entity, so a correction is never sent before it
+        self._provisional[target.entity_id] = state
+        self._enqueue_state(state)
+
+    @callback
+    def _correct_state(self, entity_id: str) -> None:
+        """Report the real state of an entity after an optimistic report."""
+        state = self.hass.states.get(entity_id)
+        if isinstance(state, State):
+            self._state_encoder.reset([entity_id])
+            self._rate_limiter.deliver_now(state)
+
+    def _correct_optimistic(self, entity_ids: list[str]) -> None:
+        """A command failed, replace its optimistic reports by the real states."""
+        if self._optimistic is None:
+            return
+        for entity_id in entity_ids:
+            if self._optimistic.reconcile_failed(entity_id):
+                self._correct_state(entity_id)
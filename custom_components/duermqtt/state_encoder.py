@@ -0,0 +1,184 @@
+"""Encode entity states for upload to the Duer platform."""
+from __future__ import annotations
+
+from collections.abc import Iterable
+
+from homeassistant.core import State
+from homeassistant.helpers.json import json_bytes
+
+# attributes of the entity catalog sent by syncentity for every domain
+_COMMON_ENTITY_ATTRIBUTES = ('friendly_name', 'supported_features', 'device_class')
+
+
+class DomainEncoder:
+    """Project states of one domain down to the attributes Duer uses.
+
+    state_attributes are the attributes that change at runtime and are sent
+    with state_changed, entity_attributes are capabilities only needed in
+    the syncentity catalog.
+    """
+
+    def __init__(self, domain: str, state_attributes: tuple[str, ...] = (),
+                 entity_attributes: tuple[str, ...] = ()) -> None:
+        """Initialize."""
+        self.domain = domain
+        self._state_keys = tuple(state_attributes)
+        self._catalog_keys = tuple(dict.fromkeys(
+            _COMMON_ENTITY_ATTRIBUTES + tuple(entity_attributes)))
+        self._entity_keys = tuple(dict.fromkeys(self._catalog_keys + self._state_keys))
+
+    @property
+    def state_keys(self) -> tuple[str, ...]:
+        return self._state_keys
+
+    @staticmethod
+    def _project(state: State, keys: tuple[str, ...]) -> dict:
+        attrs = state.attributes
+        return {
+            'entity_id': state.entity_id,
+            'state': state.state,
+            'attributes': {key: attrs[key] for key in keys if key in attrs},
+            'last_changed': state.last_changed.isoformat(),
+            'last_updated': state.last_updated.isoformat(),
+        }
+
+    def encode_state(self, state: State) -> dict:
+        return self._project(state, self._state_keys)
+
+    def encode_entity(self, state: State) -> dict:
+        return self._project(state, self._entity_keys)
+
+    def encode_catalog(self, state: State) -> dict:
+        attrs = state.attributes
+        return {
+            'entity_id': state.entity_id,
+            'attributes': {key: attrs[key] for key in self._catalog_keys if key in attrs},
+        }
+
+
+DOMAIN_ENCODERS: dict[str, DomainEncoder] = {
+    encoder.domain: encoder for encoder in (
+        DomainEncoder('button'),
+        DomainEncoder(
+            'climate',
+            ('temperature', 'target_temp_high', 'target_temp_low', 'current_temperature',
+             'hvac_action', 'fan_mode', 'swing_mode', 'preset_mode'),
+            ('hvac_modes', 'min_temp', 'max_temp', 'target_temp_step',
+             'fan_modes', 'swing_modes', 'preset_modes'),
+        ),
+        DomainEncoder(
+            'cover',
+            ('current_position', 'current_tilt_position'),
+        ),
+        DomainEncoder(
+            'fan',
+            ('percentage', 'preset_mode', 'oscillating', 'direction'),
+            ('percentage_step', 'preset_modes'),
+        ),
+        DomainEncoder('input_button'),
+        DomainEncoder(
+            'light',
+            ('brightness', 'color_mode', 'color_temp_kelvin', 'color_temp',
+             'hs_color', 'rgb_color'),
+            ('supported_color_modes', 'min_color_temp_kelvin', 'max_color_temp_kelvin',
+             'min_mireds', 'max_mireds'),
+        ),
+        DomainEncoder('scene'),
+        DomainEncoder('switch'),
+        DomainEncoder(
+            'water_heater',
+            ('temperature', 'current_temperature', 'operation_mode', 'away_mode'),
+            ('min_temp', 'max_temp', 'operation_list'),
+        ),
+    )
+}
+
+
+def encode_state(state: State, full_attributes: bool = False) -> dict:
+    """Encode a state for state_changed, unknown domains are sent with all attributes."""
+    if full_attributes or (encoder := DOMAIN_ENCODERS.get(state.domain)) is None:
+        return state.as_dict()
+    return encoder.encode_state(state)
+
+
+def encode_state_json(state: State, full_attributes: bool = False) -> bytes:
+    """Json of encode_state, all attributes reuse the json HA already cached for the state."""
+    if full_attributes or (encoder := DOMAIN_ENCODERS.get(state.domain)) is None:
+        return state.as_dict_json
+    return json_bytes(encoder.encode_state(state))
+
+
+def encode_entity_json(state: State, full_attributes: bool = False) -> bytes:
+    """Json of a state for the syncentity catalog."""
+    if full_attributes or (encoder := DOMAIN_ENCODERS.get(state.domain)) is None:
+        return state.as_dict_json
+    return json_bytes(encoder.encode_entity(state))
+
+
+def encode_catalog_json(state: State) -> bytes:
+    """Json of the parts of a state that describe the device rather than its current state."""
+    if (encoder := DOMAIN_ENCODERS.get(state.domain)) is None:
+        attrs = state.attributes
+        return json_bytes({
+            'entity_id': state.entity_id,
+            'attributes': {key: attrs[key] for key in _COMMON_ENTITY_ATTRIBUTES if key in attrs},
+        })
+    return json_bytes(encoder.encode_catalog(state))
+
+
+def json_array(fragments: list[bytes]) -> bytes:
+    """Join already encoded json fragments into a json array."""
+    return b'[' + b','.join(fragments) + b']'
+
+
+class StateDeltaEncoder:
+    """Keep the last sent state per entity and encode new states as deltas.
+
+    Every encoded state carries a per-entity sequence number. The first state
+    of an entity, or the first one after reset(), is sent as a full snapshot.
+    """
+
+    def __init__(self) -> None:
+        """Initialize."""
+        self._last_sent: dict[str, dict] = {}
+        self._seq: dict[str, int] = {}
+
+    def reset(self, entity_ids: Iterable[str] | None = None) -> None:
+        """Forget the last sent states so the next upload is a full snapshot."""
+        if entity_ids is None:
+            self._last_sent.clear()
+            return
+        for entity_id in entity_ids:
+            self._last_sent.pop(entity_id, None)
+
+    def encode(self, data: dict) -> tuple[int, dict | None]:
+        """Return the sequence number and the delta, or None when a full snapshot is due."""
+        entity_id = data['entity_id']
+        seq = self._seq.get(entity_id, 0) + 1
+        self._seq[entity_id] = seq
+        last = self._last_sent.get(entity_id)
+        self._last_sent[entity_id] = data
+        if last is None:
+            return seq, None
+        delta = {
+            'entity_id': entity_id,
+            'seq': seq,
+            'full': False,
+            'last_updated': data['last_updated'],
+        }
+        if last['state'] != data['state']:
+            delta['state'] = data['state']
+        if last['last_changed'] != data['last_changed']:
+            delta['last_changed'] = data['last_changed']
+        last_attrs = last['attributes']
+        attrs = data['attributes']
+        changed = {
+            key: value for key, value in attrs.items()
+            if key not in last_attrs or last_attrs[key] != value
+        }
+        if changed:
+            delta['attributes'] = changed
+        removed = [key for key in last_attrs if key not in attrs]
+        if removed:
+            delta['removed_attributes'] = removed
+        return seq, delta
@@ -0,0 +1,71 @@
+"""Drop state changes that are not significant for Duer before they are queued."""
+from __future__ import annotations
+
+from collections.abc import Mapping
+from typing import Any
+
+from homeassistant.core import HomeAssistant, State, callback
+from homeassistant.helpers.significant_change import (
+    SignificantlyChangedChecker,
+    create_checker,
+)
+
+from .const import DOMAIN, SIGNIFICANT_DEADBANDS
+from .state_encoder import DOMAIN_ENCODERS
+
+
+class SignificantStateFilter:
+    """Compare each state with the last accepted one of the entity.
+
+    HA runs the extra check first: it compares only the attributes Duer
+    receives, numbers within SIGNIFICANT_DEADBANDS of the accepted value
+    count as unchanged, and its False is final. Only when it returns None
+    does the significant_change platform of the domain decide, if any.
+    """
+
+    def __init__(self, hass: HomeAssistant, full_attributes: bool = False) -> None:
+        """Initialize."""
+        self.hass = hass
+        self._full_attributes = full_attributes
+        self._checker: SignificantlyChangedChecker = None
+        self.filtered = 0
+
+    async def async_setup(self) -> None:
+        self._checker = await create_checker(self.hass, DOMAIN, self._extra_significant_check)
+
+    @callback
+    def is_significant(self, state: State) -> bool:
+        if self._checker is None:
+            return True
+        if self._checker.async_is_significant_change(state, extra_arg=state.domain):
+            return True
+        self.filtered += 1
+        return False
+
+    def _extra_significant_check(
+        self,
+        hass: HomeAssistant,
+        old_state: str,
+        old_attrs: Mapping[str, Any],
+        old_domain: Any,
+        new_state: str,
+        new_attrs: Mapping[str, Any],
+        new_domain: Any,
+    ) -> bool | None:
+        if old_state != new_state:
+            return None
+        encoder = None if self._full_attributes else DOMAIN_ENCODERS.get(new_domain)
+        keys = encoder.state_keys if encoder else old_attrs.keys() | new_attrs.keys()
+        for key in keys:
+            old_value = old_attrs.get(key)
+            new_value = new_attrs.get(key)
+            if old_value == new_value:
+                continue
+            deadband = SIGNIFICANT_DEADBANDS.get(key)
+            if (deadband is None
+                    or not isinstance(old_value, (int, float))
+                    or not isinstance(new_value, (int, float))
+                    or abs(new_value - old_value) >= deadband):
+                # let the other checks decide, unknown means significant
+                return None
+        return False
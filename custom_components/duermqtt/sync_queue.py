@@ -0,0 +1,206 @@
+"""Pending state queue for the state sync loop."""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+
+from homeassistant.core import State
+
+from .const import (
+    OVERFLOW_BLOCK,
+    OVERFLOW_DROP_NEWEST,
+    OVERFLOW_KEEP_LATEST,
+    QUEUE_BLOCK_TIMEOUT,
+    SYNC_LANE_WEIGHTS,
+)
+from .metrics import LatencyWindow
+
+LANE_INTERACTIVE = 0
+LANE_BACKGROUND = 1
+
+
+class PendingStateQueue:
+    """Pending states keyed by entity_id, in an interactive and a background lane.
+
+    A newer state replaces an unsent older one of the same entity and keeps
+    its position, so memory is bounded by the number of tracked entities
+    instead of the event rate. A state put in the interactive lane moves its
+    entity there, an entity stays in the interactive lane until sent.
+
+    Lanes are served by weighted round robin, SYNC_LANE_WEIGHTS states of
+    each lane per round, so neither lane starves the other.
+
+    A state of an entity that is not pending yet overflows the queue when
+    it would exceed max_items or max_bytes (0 for no limit), the policy
+    decides what happens: drop_oldest and keep_latest evict the oldest
+    states, background lane first, drop_newest refuses the new state and
+    block holds it until room is made or QUEUE_BLOCK_TIMEOUT passes.
+    Evicted and refused states are passed to on_overflow.
+    """
+
+    def __init__(self, delays: tuple[LatencyWindow, ...] | None = None,
+                 weights: tuple[int, ...] = SYNC_LANE_WEIGHTS,
+                 max_items: int = 0, max_bytes: int = 0, policy: str = OVERFLOW_KEEP_LATEST,
+                 on_overflow: Callable[[list[State]], None] | None = None,
+                 block_timeout: float = QUEUE_BLOCK_TIMEOUT) -> None:
+        """Initialize."""
+        self._lanes: tuple[OrderedDict[str, tuple[State, float, int]], ...] = tuple(
+            OrderedDict() for _ in weights)
+        self._weights = weights
+        self._credits = list(weights)
+        self._delays = delays
+        self._max_items = max_items
+        self._max_bytes = max_bytes
+        self._policy = policy
+        self._on_overflow = on_overflow
+        self._block_timeout = block_timeout
+        self._blocked: OrderedDict[str, tuple[State, int, asyncio.TimerHandle]] = OrderedDict()
+        self._bytes = 0
+        self._event = asyncio.Event()
+        self.coalesced = 0
+        self.overflowed = 0
+
+    def __len__(self) -> int:
+        return sum(len(lane) for lane in self._lanes)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    @property
+    def blocked(self) -> int:
+        return len(self._blocked)
+
+    def empty(self) -> bool:
+        return not any(self._lanes)
+
+    def lane_size(self, lane: int) -> int:
+        return len(self._lanes[lane])
+
+    def put(self, state: State, lane: int = LANE_BACKGROUND) -> None:
+        entity_id = state.entity_id
+        # the cached json of the state, an upper bound of what is uploaded
+        size = len(state.as_dict_json)
+        for index, pending in enumerate(self._lanes):
+            if (entry := pending.get(entity_id)) is None:
+                continue
+            # replacing a pending state never overflows the queue
+            self.coalesced += 1
+            self._bytes += size - entry[2]
+            if index <= lane:
+                # keep the position and the enqueue time of the unsent state
+                pending[entity_id] = (state, entry[1], size)
+            else:
+                del pending[entity_id]
+                self._lanes[lane][entity_id] = (state, entry[1], size)
+            self._event.set()
+            return
+        if (blocked := self._blocked.get(entity_id)) is not None:
+            self.coalesced += 1
+            self._blocked[entity_id] = (state, min(lane, blocked[1]), blocked[2])
+            return
+        if self._would_overflow(size):
+            if self._policy == OVERFLOW_DROP_NEWEST:
+                self._overflow([state])
+                return
+            if self._policy == OVERFLOW_BLOCK:
+                self._blocked[entity_id] = (state, lane, asyncio.get_running_loop().call_later(
+                    self._block_timeout, self._expire_blocked, entity_id))
+                return
+            self._overflow(self._evict(size))
+        self._add(state, lane, time.monotonic(), size)
+
+    def _add(self, state: State, lane: int, enqueued_at: float, size: int) -> None:
+        self._lanes[lane][state.entity_id] = (state, enqueued_at, size)
+        self._bytes += size
+        self._event.set()
+
+    def _would_overflow(self, size: int) -> bool:
+        return ((self._max_items > 0 and len(self) >= self._max_items)
+                or (self._max_bytes > 0 and self._bytes + size > self._max_bytes))
+
+    def _evict(self, size: int) -> list[State]:
+        """Remove the oldest states until a state of size fits, background lane first."""
+        evicted = []
+        for pending in reversed(self._lanes):
+            while pending and self._would_overflow(size):
+                state, _, state_size = pending.popitem(last=False)[1]
+                self._bytes -= state_size
+                evicted.append(state)
+        return evicted
+
+    def _overflow(self, states: list[State]) -> None:
+        if not states:
+            return
+        self.overflowed += len(states)
+        if self._on_overflow is not None:
+            self._on_overflow(states)
+
+    def _expire_blocked(self, entity_id: str) -> None:
+        if (blocked := self._blocked.pop(entity_id, None)) is not None:
+            self._overflow([blocked[0]])
+
+    def _admit_blocked(self) -> None:
+        while self._blocked:
+            entity_id, (state, lane, timer) = next(iter(self._blocked.items()))
+            size = len(state.as_dict_json)
+            if self._would_overflow(size):
+                return
+            del self._blocked[entity_id]
+            timer.cancel()
+            self._add(state, lane, time.monotonic(), size)
+
+    def _next_lane(self) -> int | None:
+        for _ in range(2):
+            for index, pending in enumerate(self._lanes):
+                if pending and self._credits[index] > 0:
+                    return index
+            if not self.empty():
+                self._credits = list(self._weights)
+        return None
+
+    def pop_many(self, max_items: int) -> list[State]:
+        states = []
+        now = time.monotonic()
+        while len(states) < max_items and (lane := self._next_lane()) is not None:
+            self._credits[lane] -= 1
+            state, enqueued_at, size = self._lanes[lane].popitem(last=False)[1]
+            self._bytes -= size
+            if self._delays is not None:
+                self._delays[lane].add((now - enqueued_at) * 1000)
+            states.append(state)
+        if self._blocked:
+            self._admit_blocked()
+        if self.empty():
+            self._event.clear()
+        return states
+
+    def drain(self) -> list[State]:
+        """Remove every pending and blocked state."""
+        blocked, self._blocked = self._blocked, OrderedDict()
+        states = self.pop_many(len(self))
+        for state, _, timer in blocked.values():
+            timer.cancel()
+            states.append(state)
+        return states
+
+    async def _wait_put(self) -> None:
+        self._event.clear()
+        await self._event.wait()
+
+    async def get_batch(self, max_items: int = 1, interval: float = 0) -> list[State]:
+        """Wait for pending states, then keep collecting until max_items or interval seconds.
+
+        An interactive state ends the collecting at once.
+        """
+        while self.empty():
+            await self._wait_put()
+        if max_items > 1 and interval > 0:
+            with contextlib.suppress(TimeoutError):
+                async with asyncio.timeout(interval):
+                    while len(self) < max_items and not self._lanes[LANE_INTERACTIVE]:
+                        await self._wait_put()
+        return self.pop_many(max_items)
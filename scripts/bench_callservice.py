@@ -0,0 +1,127 @@
+"""Time a callservice command from the mqtt handler to the service handler.
+
+Compares the path before the dispatch index (split the entity id, copy
+service_data, add_job a non blocking async_call) with DuerService._call_service
+(index validation, then an eager task running a blocking async_call).
+
+Needs homeassistant and paho-mqtt installed, run from the repository root:
+
+    python scripts/bench_callservice.py [--commands 20000] [--entities 500]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from homeassistant.core import HomeAssistant, ServiceCall  # noqa: E402
+
+from custom_components.duermqtt.service import DuerService  # noqa: E402
+
+
+def old_call_service(hass: HomeAssistant, data: dict) -> None:
+    """DuerService._call_service before the dispatch index."""
+    service = data.get('service')
+    s_data = data.get('service_data')
+    entity_id = data.get('entity_id')
+    domain = entity_id.split('.')[0]
+    if not s_data:
+        s_data = {
+            'entity_id': entity_id
+        }
+    if isinstance(s_data, dict):
+        s_data['entity_id'] = entity_id
+    hass.add_job(hass.services.async_call(
+        domain=domain, service=service, service_data=s_data, blocking=False
+    ))
+
+
+class _Handler:
+    """Light service handler resolving a future when a call arrives."""
+
+    def __init__(self) -> None:
+        self.waiter: asyncio.Future | None = None
+        self.remaining = 0
+
+    def service(self):
+        # HA only awaits handlers that are coroutine functions, not callable objects
+        async def _handle(call: ServiceCall) -> None:
+            self.remaining -= 1
+            if self.remaining <= 0 and self.waiter is not None and not self.waiter.done():
+                self.waiter.set_result(time.perf_counter())
+        return _handle
+
+
+async def _latency(handler: _Handler, call, commands: list[dict]) -> list[float]:
+    """Microseconds from the call to the service handler, one command at a time."""
+    loop = asyncio.get_running_loop()
+    samples = []
+    for data in commands:
+        handler.remaining = 1
+        handler.waiter = loop.create_future()
+        start = time.perf_counter()
+        call(data)
+        samples.append((await handler.waiter - start) * 1e6)
+    return samples
+
+
+async def _burst(handler: _Handler, call, commands: list[dict]) -> float:
+    """Commands per second when every command arrives at once."""
+    handler.remaining = len(commands)
+    handler.waiter = asyncio.get_running_loop().create_future()
+    start = time.perf_counter()
+    for data in commands:
+        call(data)
+    return len(commands) / (await handler.waiter - start)
+
+
+def _commands(count: int, entities: int) -> list[dict]:
+    return [{'type': 'callservice', 'entity_id': f'light.bench_{index % entities}',
+             'service': 'turn_on', 'service_data': {'brightness': index % 256}}
+            for index in range(count)]
+
+
+def _report(name: str, samples: list[float], rate: float) -> None:
+    samples = sorted(samples)
+    print(f'{name:<5} p50 {statistics.median(samples):7.1f} us'
+          f'  p95 {samples[int(len(samples) * 0.95)]:7.1f} us'
+          f'  burst {rate:9.0f} commands/s')
+
+
+async def main(count: int, entities: int) -> None:
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = HomeAssistant(config_dir)
+        handler = _Handler()
+        hass.services.async_register('light', 'turn_on', handler.service())
+        for index in range(entities):
+            hass.states.async_set(f'light.bench_{index}', 'off')
+        service = DuerService(hass, 'bench')
+        service._command_index.async_setup([f'light.bench_{index}' for index in range(entities)])
+
+        paths = {
+            'old': lambda data: old_call_service(hass, data),
+            'new': lambda data: service._call_service(data, time.monotonic()),
+        }
+        # warm up both paths before measuring
+        for call in paths.values():
+            await _latency(handler, call, _commands(1000, entities))
+        for name, call in paths.items():
+            samples = await _latency(handler, call, _commands(count, entities))
+            _report(name, samples, await _burst(handler, call, _commands(count, entities)))
+
+        service._command_index.async_stop()
+        await hass.async_stop(force=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--commands', type=int, default=20000)
+    parser.add_argument('--entities', type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main(args.commands, args.entities))
@@ -0,0 +1,10 @@
+"""Tests of the HA independent parts of the integration.
+
+Need homeassistant, paho-mqtt and pytest installed, run from the repository root:
+
+    python -m pytest tests
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,43 @@
+"""Tests of the entity catalog fingerprint."""
+import asyncio
+
+from homeassistant.core import HomeAssistant, State
+
+from custom_components.duermqtt.catalog import EntityCatalog, catalog_fingerprint, entity_hash
+
+
+def _catalog(tmp_path, hashes: dict[str, str]) -> tuple[list[str], list[str]]:
+    """Diff hashes against a catalog holding a, b and c."""
+    async def _test():
+        hass = HomeAssistant(str(tmp_path))
+        catalog = EntityCatalog(hass, 'duermqtt.catalog.test')
+        catalog.hashes = {'light.a': '1', 'light.b': '2', 'light.c': '3'}
+        try:
+            return catalog.diff(hashes)
+        finally:
+            await hass.async_stop(force=True)
+
+    return asyncio.run(_test())
+
+
+def test_diff_finds_added_changed_and_removed(tmp_path):
+    changed, removed = _catalog(tmp_path, {'light.a': '1', 'light.b': 'x', 'light.d': '4'})
+    assert changed == ['light.b', 'light.d']
+    assert removed == ['light.c']
+
+
+def test_diff_of_same_catalog_is_empty(tmp_path):
+    assert _catalog(tmp_path, {'light.a': '1', 'light.b': '2', 'light.c': '3'}) == ([], [])
+
+
+def test_entity_hash_ignores_state_and_follows_salt():
+    on = State('light.a', 'on', {'friendly_name': 'A', 'brightness': 10})
+    off = State('light.a', 'off', {'friendly_name': 'A'})
+    assert entity_hash(on) == entity_hash(off)
+    assert entity_hash(on, 'full_attributes=True') != entity_hash(on, 'full_attributes=False')
+    assert entity_hash(State('light.a', 'on', {'friendly_name': 'B'})) != entity_hash(on)
+
+
+def test_fingerprint_does_not_depend_on_order():
+    assert catalog_fingerprint({'a': '1', 'b': '2'}) == catalog_fingerprint({'b': '2', 'a': '1'})
+    assert catalog_fingerprint({'a': '1'}) != catalog_fingerprint({'a': '2'})
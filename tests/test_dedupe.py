@@ -0,0 +1,56 @@
+"""Tests of CommandDedupeCache."""
+import pytest
+
+from custom_components.duermqtt import dedupe
+from custom_components.duermqtt.dedupe import CommandDedupeCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(dedupe.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_repeated_id_is_duplicate(clock):
+    cache = CommandDedupeCache(ttl=10)
+    assert cache.check('a') == (False, None)
+    assert cache.check('a') == (True, None)
+    assert cache.suppressed == 1
+
+
+def test_duplicate_returns_cached_outcome(clock):
+    cache = CommandDedupeCache(ttl=10)
+    cache.check('a')
+    cache.set_outcome('a', {'status': 'done'})
+    assert cache.check('a') == (True, {'status': 'done'})
+
+
+def test_id_expires_ttl_after_last_seen(clock):
+    cache = CommandDedupeCache(ttl=10)
+    cache.check('a')
+    clock[0] += 8
+    assert cache.check('a')[0]
+    # seen again at 108, still known at 116
+    clock[0] += 8
+    assert cache.check('a')[0]
+    clock[0] += 10
+    assert cache.check('a') == (False, None)
+
+
+def test_expired_id_is_not_duplicate_among_fresh_ones(clock):
+    cache = CommandDedupeCache(ttl=10)
+    cache.check('a')
+    clock[0] += 5
+    cache.check('b')
+    clock[0] += 6
+    assert not cache.check('a')[0]
+    assert cache.check('b')[0]
+
+
+def test_size_bounds_cache(clock):
+    cache = CommandDedupeCache(size=2, ttl=10)
+    for command_id in ('a', 'b', 'c'):
+        cache.check(command_id)
+    assert len(cache) == 2
+    assert not cache.check('a')[0]
@@ -0,0 +1,86 @@
+"""Tests of StateRateLimiter."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from homeassistant.core import State
+
+from custom_components.duermqtt.rate_limiter import StateRateLimiter, parse_domain_intervals
+
+
+def _limiter(delivered: list, min_interval: float, domain_intervals=None) -> StateRateLimiter:
+    hass = SimpleNamespace(loop=asyncio.get_running_loop())
+    return StateRateLimiter(hass, lambda state: delivered.append(state.state),
+                            min_interval, domain_intervals)
+
+
+def test_parse_domain_intervals():
+    assert parse_domain_intervals('climate=5, light=0.5,') == {'climate': 5.0, 'light': 0.5}
+    assert parse_domain_intervals(None) == {}
+    with pytest.raises(ValueError):
+        parse_domain_intervals('climate')
+    with pytest.raises(ValueError):
+        parse_domain_intervals('=5')
+
+
+def test_first_state_passes_then_latest_is_delivered_after_interval():
+    async def _test():
+        delivered = []
+        limiter = _limiter(delivered, 0.05)
+        limiter.process(State('light.a', '1'))
+        limiter.process(State('light.a', '2'))
+        limiter.process(State('light.a', '3'))
+        assert delivered == ['1']
+        assert limiter.suppressed == 1
+        await asyncio.sleep(0.1)
+        assert delivered == ['1', '3']
+
+    asyncio.run(_test())
+
+
+def test_entities_are_limited_independently():
+    async def _test():
+        delivered = []
+        limiter = _limiter(delivered, 10)
+        limiter.process(State('light.a', 'a'))
+        limiter.process(State('light.b', 'b'))
+        assert delivered == ['a', 'b']
+
+    asyncio.run(_test())
+
+
+def test_domain_interval_overrides_min_interval():
+    async def _test():
+        delivered = []
+        limiter = _limiter(delivered, 10, {'switch': 0})
+        for value in ('1', '2'):
+            limiter.process(State('switch.a', value))
+            limiter.process(State('light.a', value))
+        assert delivered == ['1', '1', '2']
+
+    asyncio.run(_test())
+
+
+def test_deliver_now_drops_held_state():
+    async def _test():
+        delivered = []
+        limiter = _limiter(delivered, 0.05)
+        limiter.process(State('light.a', 'first'))
+        limiter.process(State('light.a', 'stale'))
+        limiter.deliver_now(State('light.a', 'now'))
+        await asyncio.sleep(0.1)
+        assert delivered == ['first', 'now']
+
+    asyncio.run(_test())
+
+
+def test_flush_delivers_held_states():
+    async def _test():
+        delivered = []
+        limiter = _limiter(delivered, 10)
+        limiter.process(State('light.a', '1'))
+        limiter.process(State('light.a', '2'))
+        limiter.flush()
+        assert delivered == ['1', '2']
+
+    asyncio.run(_test())
@@ -0,0 +1,48 @@
+"""Tests of StateDeltaEncoder and the domain projection."""
+from homeassistant.core import State
+
+from custom_components.duermqtt.state_encoder import StateDeltaEncoder, encode_state
+
+
+def _light(state: str, **attributes) -> dict:
+    return encode_state(State('light.a', state, attributes))
+
+
+def test_domain_projection_keeps_state_attributes():
+    data = _light('on', brightness=10, friendly_name='A', effect_list=['x'])
+    assert data['attributes'] == {'brightness': 10}
+    assert encode_state(State('light.a', 'on', {'effect_list': ['x']}), True)[
+        'attributes'] == {'effect_list': ['x']}
+
+
+def test_first_state_is_full_snapshot():
+    encoder = StateDeltaEncoder()
+    assert encoder.encode(_light('on', brightness=10)) == (1, None)
+
+
+def test_delta_holds_changed_and_removed_attributes():
+    encoder = StateDeltaEncoder()
+    encoder.encode(_light('on', brightness=10, color_mode='hs'))
+    seq, delta = encoder.encode(_light('on', brightness=20))
+    assert seq == 2
+    assert delta['full'] is False
+    assert delta['attributes'] == {'brightness': 20}
+    assert delta['removed_attributes'] == ['color_mode']
+    assert 'state' not in delta
+
+
+def test_delta_holds_changed_state():
+    encoder = StateDeltaEncoder()
+    encoder.encode(_light('on'))
+    _, delta = encoder.encode(_light('off'))
+    assert delta['state'] == 'off'
+    assert 'attributes' not in delta
+
+
+def test_reset_forces_full_snapshot_and_keeps_sequence():
+    encoder = StateDeltaEncoder()
+    encoder.encode(_light('on'))
+    encoder.reset(['light.a'])
+    assert encoder.encode(_light('off')) == (2, None)
+    encoder.reset()
+    assert encoder.encode(_light('on')) == (3, None)
@@ -0,0 +1,153 @@
+"""Tests of PendingStateQueue."""
+import asyncio
+
+from homeassistant.core import State
+
+from custom_components.duermqtt.const import (
+    OVERFLOW_BLOCK,
+    OVERFLOW_DROP_NEWEST,
+    OVERFLOW_DROP_OLDEST,
+)
+from custom_components.duermqtt.sync_queue import (
+    LANE_BACKGROUND,
+    LANE_INTERACTIVE,
+    PendingStateQueue,
+)
+
+
+def _ids(states: list[State]) -> list[str]:
+    return [state.entity_id for state in states]
+
+
+def test_newer_state_replaces_pending_one_in_place():
+    queue = PendingStateQueue()
+    queue.put(State('light.a', 'on'))
+    queue.put(State('light.b', 'on'))
+    queue.put(State('light.a', 'off'))
+    assert len(queue) == 2
+    assert queue.coalesced == 1
+    states = queue.pop_many(10)
+    assert _ids(states) == ['light.a', 'light.b']
+    assert states[0].state == 'off'
+    assert queue.size_bytes == 0
+
+
+def test_interactive_state_moves_entity_to_interactive_lane():
+    queue = PendingStateQueue()
+    queue.put(State('light.a', 'on'))
+    queue.put(State('light.b', 'on'))
+    queue.put(State('light.b', 'off'), LANE_INTERACTIVE)
+    assert queue.lane_size(LANE_INTERACTIVE) == 1
+    assert queue.lane_size(LANE_BACKGROUND) == 1
+    # a later background state keeps the entity in the interactive lane
+    queue.put(State('light.b', 'on'), LANE_BACKGROUND)
+    assert queue.lane_size(LANE_INTERACTIVE) == 1
+    assert _ids(queue.pop_many(10)) == ['light.b', 'light.a']
+
+
+def test_lanes_are_served_by_weighted_round_robin():
+    queue = PendingStateQueue(weights=(2, 1))
+    for index in range(4):
+        queue.put(State(f'light.i{index}', 'on'), LANE_INTERACTIVE)
+        queue.put(State(f'light.b{index}', 'on'), LANE_BACKGROUND)
+    assert _ids(queue.pop_many(8)) == [
+        'light.i0', 'light.i1', 'light.b0',
+        'light.i2', 'light.i3', 'light.b1',
+        'light.b2', 'light.b3',
+    ]
+
+
+def test_drop_oldest_evicts_background_lane_first():
+    overflowed = []
+    queue = PendingStateQueue(max_items=2, policy=OVERFLOW_DROP_OLDEST,
+                              on_overflow=overflowed.extend)
+    queue.put(State('light.i', 'on'), LANE_INTERACTIVE)
+    queue.put(State('light.b', 'on'))
+    queue.put(State('light.new', 'on'))
+    assert _ids(overflowed) == ['light.b']
+    assert queue.overflowed == 1
+    assert _ids(queue.pop_many(10)) == ['light.i', 'light.new']
+
+
+def test_replacing_pending_state_never_overflows():
+    overflowed = []
+    queue = PendingStateQueue(max_items=1, policy=OVERFLOW_DROP_OLDEST,
+                              on_overflow=overflowed.extend)
+    queue.put(State('light.a', 'on'))
+    queue.put(State('light.a', 'off'))
+    assert not overflowed
+    assert len(queue) == 1
+
+
+def test_drop_newest_refuses_new_entity():
+    overflowed = []
+    queue = PendingStateQueue(max_items=1, policy=OVERFLOW_DROP_NEWEST,
+                              on_overflow=overflowed.extend)
+    queue.put(State('light.a', 'on'))
+    queue.put(State('light.b', 'on'))
+    assert _ids(overflowed) == ['light.b']
+    assert _ids(queue.pop_many(10)) == ['light.a']
+
+
+def test_max_bytes_limits_queue():
+    state = State('light.a', 'on')
+    overflowed = []
+    queue = PendingStateQueue(max_bytes=len(state.as_dict_json) + 1, policy=OVERFLOW_DROP_NEWEST,
+                              on_overflow=overflowed.extend)
+    queue.put(state)
+    queue.put(State('light.b', 'on'))
+    assert _ids(overflowed) == ['light.b']
+
+
+def test_block_admits_held_state_when_room_is_made():
+    async def _test():
+        queue = PendingStateQueue(max_items=1, policy=OVERFLOW_BLOCK, block_timeout=10)
+        queue.put(State('light.a', 'on'))
+        queue.put(State('light.b', 'on'))
+        # a newer state of a held entity replaces the held one
+        queue.put(State('light.b', 'off'))
+        assert queue.blocked == 1
+        assert _ids(queue.pop_many(1)) == ['light.a']
+        assert queue.blocked == 0
+        states = queue.pop_many(1)
+        assert _ids(states) == ['light.b']
+        assert states[0].state == 'off'
+
+    asyncio.run(_test())
+
+
+def test_block_expires_held_state():
+    async def _test():
+        overflowed = []
+        queue = PendingStateQueue(max_items=1, policy=OVERFLOW_BLOCK, block_timeout=0.01,
+                                  on_overflow=overflowed.extend)
+        queue.put(State('light.a', 'on'))
+        queue.put(State('light.b', 'on'))
+        await asyncio.sleep(0.05)
+        assert queue.blocked == 0
+        assert _ids(overflowed) == ['light.b']
+
+    asyncio.run(_test())
+
+
+def test_drain_returns_pending_and_blocked_states():
+    async def _test():
+        queue = PendingStateQueue(max_items=1, policy=OVERFLOW_BLOCK, block_timeout=10)
+        queue.put(State('light.a', 'on'))
+        queue.put(State('light.b', 'on'))
+        assert _ids(queue.drain()) == ['light.a', 'light.b']
+        assert queue.empty()
+        assert queue.blocked == 0
+
+    asyncio.run(_test())
+
+
+def test_get_batch_returns_early_on_interactive_state():
+    async def _test():
+        queue = PendingStateQueue()
+        queue.put(State('light.a', 'on'))
+        queue.put(State('light.b', 'on'), LANE_INTERACTIVE)
+        states = await asyncio.wait_for(queue.get_batch(10, 5), 1)
+        assert _ids(states) == ['light.b', 'light.a']
+
+    asyncio.run(_test())